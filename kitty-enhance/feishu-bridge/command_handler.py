@@ -13,7 +13,17 @@ ID 支持：
 - 新格式: #12@mykitty-1827907
 """
 
-import re
+from __future__ import annotations
+
+PERMISSION_WORDS = frozenset({"y", "n", "yes", "no", "是", "否"})
+HELP_WORDS = frozenset({"help", "?", "？", "帮助"})
+LIST_WORDS = frozenset({"ls", "列表", "list", "终端"})
+SCREEN_WORDS = frozenset({"进度", "屏幕", "screen", "progress", "log"})
+KEY_WORDS = {"esc": "esc", "ctrl+c": "ctrl-c"}  # 指令文本 → kitty 键名
+_MAX_CONTROL_WORD_LEN = max(len(w) for w in (*KEY_WORDS, "clear"))
+
+# 兼容全角 ＃（飞书输入法可能产生）
+_SELECTOR_PREFIXES = "#@＃"
 
 
 def parse_command(text: str) -> dict:
@@ -22,40 +32,59 @@ def parse_command(text: str) -> dict:
     if not text:
         return {"type": "unknown"}
 
+    # #ID / @ID / ＃ID 开头的指令（不再匹配纯数字，避免误触）
+    # 前缀已决定分支，无需对可能很长的指令文本整体 lower()
+    if text[0] in _SELECTOR_PREFIXES:
+        parts = _split_selector(text)
+        if parts:
+            return _parse_terminal_command(*parts)
+        return {"type": "ignore"}
+
     lower = text.lower()
 
     # 权限回复（最高优先级，兼容现有功能）
-    if lower in ("y", "n", "yes", "no", "是", "否"):
+    if lower in PERMISSION_WORDS:
         return {"type": "permission_reply", "answer": lower}
 
     # 帮助
-    if lower in ("help", "?", "？", "帮助"):
+    if lower in HELP_WORDS:
         return {"type": "help"}
 
     # 终端列表（ls -l 详细模式）- 先检查长格式
     if lower == "ls -l":
         return {"type": "list_terminals", "detail": True}
-    if lower in ("ls", "列表", "list", "终端"):
+    if lower in LIST_WORDS:
         return {"type": "list_terminals", "detail": False}
 
-    # #ID / @ID / ＃ID 开头的指令（不再匹配纯数字，避免误触）
-    # 兼容全角 ＃（飞书输入法可能产生）
-    match = re.match(r"[#@＃]([^\s]+)\s*(.*)", text)
-    if match:
-        selector = match.group(1)
-        rest = match.group(2).strip()
-        if not rest:
-            return {"type": "terminal_detail", "window_id": selector}
-        if rest in ("进度", "屏幕", "screen", "progress", "log"):
-            return {"type": "terminal_screen", "window_id": selector}
-        # 特殊按键指令
-        if rest.lower() == "esc":
-            return {"type": "terminal_key", "window_id": selector, "key": "esc"}
-        if rest.lower() == "ctrl+c":
-            return {"type": "terminal_key", "window_id": selector, "key": "ctrl-c"}
-        if rest.lower() == "clear":
-            return {"type": "terminal_clear", "window_id": selector}
-        return {"type": "terminal_command", "window_id": selector, "text": rest}
-
     # 不匹配任何指令 → 静默忽略
     return {"type": "ignore"}
+
+
+def _split_selector(text: str) -> tuple[str, str] | None:
+    """拆分 "#ID 指令文本"，返回 (ID, 指令首行)；前缀后紧跟空白时返回 None
+
+    用 str.split 而非正则：消息热路径上省去 SRE 匹配与 Match 对象分配。
+    多行消息只取第一行作为指令。
+    """
+    head, *tail = text.split(None, 1)
+    selector = head[1:]
+    if not selector:
+        return None
+    rest = tail[0].partition("\n")[0].strip() if tail else ""
+    return selector, rest
+
+
+def _parse_terminal_command(selector: str, rest: str) -> dict:
+    if not rest:
+        return {"type": "terminal_detail", "window_id": selector}
+    if rest in SCREEN_WORDS:
+        return {"type": "terminal_screen", "window_id": selector}
+    # 特殊按键指令：只有短文本才可能命中，长指令不做 lower()
+    if len(rest) <= _MAX_CONTROL_WORD_LEN:
+        rest_lower = rest.lower()
+        key = KEY_WORDS.get(rest_lower)
+        if key:
+            return {"type": "terminal_key", "window_id": selector, "key": key}
+        if rest_lower == "clear":
+            return {"type": "terminal_clear", "window_id": selector}
+    return {"type": "terminal_command", "window_id": selector, "text": rest}
@@ -13,26 +13,68 @@
 
 from __future__ import annotations
 
-import glob
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import heapq
 import json
 from typing import List
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import re
+import select
 import signal
 import sys
+import tempfile
 import threading
 import time
 
-import yaml
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # 非 Linux 或未安装 inotify_simple：退回定时轮询
+    INotify = None
+    inotify_flags = None
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson：使用标准库 json
+    orjson = None
+
+if orjson is not None:
+    _json_loads = orjson.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        # descriptions 等字段以 int 为 key，需与标准库一样转成字符串
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
 
 from command_handler import parse_command
-from feishu_client import FeishuClient
-from kitty_responder import clear_screen, get_terminal_screen, send_key, send_keystroke
+from feishu_client import FeishuClient, extract_text
+from kitty_responder import (
+    clear_screen,
+    get_terminal_screen,
+    send_key,
+    send_keys,
+    send_keystroke,
+    send_text_and_enter,
+)
 from terminal_registry import (
-    cleanup_all_kitty,
     load_registry,
     resolve_terminal_selector,
     scan_all_kitty,
+    scan_and_cleanup_all_kitty,
     scan_and_register,
     STATUS_TEXT,
 )
@@ -40,8 +82,48 @@ from terminal_registry import (
 # ── 日志配置 ──────────────────────────────────────────
 
 STATE_DIR = "/tmp/feishu-bridge"
+# 刻意不用 .json 后缀：扫描 *.json pending 文件时天然排除 PID 文件
 PID_FILE = os.path.join(STATE_DIR, "daemon.pid")
+COMPLETED_SUFFIX = "_completed.json"
+# 与 pending 共用 .json 后缀、但不是 pending 请求的文件
+_NON_PENDING_FILES = frozenset({"registry.json"})
 LOG_FILE = os.path.join(STATE_DIR, "daemon.log")
+LOG_MAX_BYTES = 5 * 1024 * 1024  # 单个日志文件上限，超过后轮转
+LOG_BACKUP_COUNT = 3
+
+# WebSocket 重连退避（秒）
+WS_BACKOFF_MIN = 0.2
+WS_BACKOFF_MAX = 60.0
+WS_STABLE_SECONDS = 60  # 连接持续超过该时长后重置退避
+WS_FATAL_SECONDS = 3600  # 连续失败超过该时长记录 critical 日志
+
+SOCKET_DETECT_TTL = 30  # 未配置 kitty socket 时，自动探测结果的缓存时长（秒）
+PENDING_COMMAND_TTL = 300  # 忙碌终端指令等待确认的时长（秒）
+PENDING_COMMANDS_MAX = 1024  # 待确认指令上限，超出时淘汰最早的
+REPLY_QUEUE_SIZE = 256  # 待处理飞书消息上限，超出时丢弃并告警
+SEEN_MSGS_TTL = 300  # 消息去重记录保留时长（秒）
+SEEN_MSGS_MAX = 4096  # 去重记录上限，超出时淘汰最早的
+SEND_POOL_WORKERS = 8  # 后台抓取屏幕 / 刷新注册表等含 kitty IPC 任务的线程数
+ACK_BATCH_MAX_BYTES = 2048  # 合并后的回执超过该长度立即发送
+_ACK = object()  # 发送队列中操作回执的标记，连续排队的回执合并为一条消息
+
+
+def _is_pending_name(name: str) -> bool:
+    return (
+        name.endswith(".json")
+        and name not in _NON_PENDING_FILES
+        and not name.endswith(COMPLETED_SUFFIX)
+    )
+
+
+def _safe_unlink(path: str):
+    """删除文件；已被删除时静默（主循环与回复线程可能并发删除同一文件）"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logger.warning("删除文件失败: %s (%s)", path, exc)
 
 
 def setup_logging():
@@ -51,7 +133,10 @@ def setup_logging():
         format="[%(asctime)s] %(levelname)s %(message)s",
         datefmt="%H:%M:%S",
         handlers=[
-            logging.FileHandler(LOG_FILE, encoding="utf-8"),
+            logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT, encoding="utf-8",
+            ),
             logging.StreamHandler(),
         ],
     )
@@ -84,11 +169,30 @@ SELECTION_SCREEN_HINTS = (
     "to navigate",
 )
 
-TEXT_INPUT_CANCEL_WORDS = ("cancel", "取消")
-
-# 需要额外输入文字的选项关键词
+TEXT_INPUT_CANCEL_WORDS = frozenset({"cancel", "取消"})
+SELECTION_CANCEL_WORDS = frozenset({"esc", "取消", "cancel"})
+REPLY_MODES = frozenset({"permission", "text_input", "selection"})
+BUSY_STATUSES = frozenset({"working", "waiting"})  # 终端忙碌，直接发指令前需确认
+STATUS_ICONS = {"working": "🟢", "completed": "🔴"}  # ls -l 状态图标，其余状态为 ⚪
+
+# 权限回复：回复词 → (是否允许, 发送到终端的按键, 回执文案)
+_ALLOW = (True, "\r", "✅ 已允许")
+_DENY = (False, "\x1b", "❌ 已拒绝")
+PERMISSION_REPLIES = {
+    "y": _ALLOW, "yes": _ALLOW, "是": _ALLOW,
+    "n": _DENY, "no": _DENY, "否": _DENY,
+}
+
+# 需要额外输入文字的选项关键词（须为小写，与 lower() 后的选项文本比较）
 SELECTION_TEXT_INPUT_KEYWORDS = ("type something", "chat about this")
 
+# 选择弹窗选项行，如 "› 1. Yes"；限制序号位数和文本长度，超宽屏幕行不做整行扫描
+_OPTION_RE = re.compile(r"^[〉>›»]?\s*(\d{1,3})\.\s+(.{0,500})")
+# 选择回复："N" 或 "N 文本"
+_NUMERIC_PREFIX_RE = re.compile(r"^(\d+)\s*(.*)")
+# 终端预览中需要清理的控制字符（保留 \t \n \r）
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f]")
+
 
 def parse_selection_screen(screen_tail: str) -> dict:
     """从终端屏幕内容解析选择弹窗的问题上下文和选项
@@ -96,26 +200,24 @@ def parse_selection_screen(screen_tail: str) -> dict:
     返回 dict:
         question: 选项上方的问题/说明文本
         options: 选项文本列表（1-based 对应）
-        text_input_indices: 需要输入文字的选项序号集合（1-based）
+        text_input_mask: 需要输入文字的选项位掩码，第 idx 位（1-based）置 1
         descriptions: {序号: 描述文本} 选项下方的缩进描述行
     """
-    import re
     options = []
-    text_input_indices = set()
+    text_input_mask = 0
     descriptions: dict[int, str] = {}
     question_lines = []
     first_option_line = -1
     last_option_idx = 0
 
     lines = screen_tail.split("\n")
-    option_pattern = re.compile(r"^[〉>›»]?\s*(\d+)\.\s+(.*)")
 
     for i, line in enumerate(lines):
         stripped = line.strip()
         if not stripped:
             continue
 
-        m = option_pattern.match(stripped)
+        m = _OPTION_RE.match(stripped)
         if m:
             idx = int(m.group(1))
             text = m.group(2).strip()
@@ -123,21 +225,20 @@ def parse_selection_screen(screen_tail: str) -> dict:
                 first_option_line = i
 
             # 填充缺失的选项（序号跳跃）
-            while len(options) < idx - 1:
-                options.append(f"选项 {len(options) + 1}")
+            if len(options) < idx - 1:
+                options.extend(f"选项 {n}" for n in range(len(options) + 1, idx))
             if len(options) < idx:
                 # TUI 选中项可能无文字（kitty get-text 捕获不到高亮行的文本）
                 options.append(text if text else f"选项 {idx}")
 
             # 检测文字输入类选项
             if any(k in text.lower() for k in SELECTION_TEXT_INPUT_KEYWORDS):
-                text_input_indices.add(idx)
+                text_input_mask |= 1 << idx
             last_option_idx = idx
-        elif first_option_line >= 0 and last_option_idx > 0:
-            # 选项下方的缩进描述行
-            if stripped and not option_pattern.match(stripped):
-                desc = descriptions.get(last_option_idx, "")
-                descriptions[last_option_idx] = (desc + " " + stripped).strip() if desc else stripped
+        elif last_option_idx > 0:
+            # 选项下方的缩进描述行（m 为 None，无需再次匹配）
+            desc = descriptions.get(last_option_idx, "")
+            descriptions[last_option_idx] = (desc + " " + stripped).strip() if desc else stripped
 
     # 提取选项上方的问题上下文
     if first_option_line > 0:
@@ -152,17 +253,29 @@ def parse_selection_screen(screen_tail: str) -> dict:
     return {
         "question": question,
         "options": options,
-        "text_input_indices": text_input_indices,
+        "text_input_mask": text_input_mask,
         "descriptions": descriptions,
     }
 
 
+def _trim_screen_tail(screen_tail: str, max_lines: int) -> str:
+    """保留最后 max_lines 行并去掉行尾填充空格"""
+    lines = screen_tail.rstrip().rsplit("\n", max_lines)[-max_lines:]
+    return "\n".join(line.rstrip() for line in lines)
+
+
 # ── 配置加载 ──────────────────────────────────────────
 
 def load_config(config_path: str | None) -> dict:
     """加载配置：环境变量优先，config.yaml 兜底"""
     file_cfg = {}
-    if config_path and os.path.exists(config_path):
+    try:
+        has_file = bool(config_path) and os.path.getsize(config_path) > 0
+    except OSError:
+        has_file = False
+    if has_file:
+        import yaml  # 仅在确有配置文件时导入，纯环境变量配置不付出 PyYAML 的导入开销
+
         with open(config_path, "r", encoding="utf-8") as f:
             file_cfg = yaml.safe_load(f) or {}
 
@@ -192,10 +305,26 @@ def load_config(config_path: str | None) -> dict:
             "registry_cleanup_interval": int(hub_file.get("registry_cleanup_interval", 30)),
             "max_screen_lines": int(hub_file.get("max_screen_lines", 20)),
             "command_max_length": int(hub_file.get("command_max_length", 500)),
+            "submit_delay": float(hub_file.get("submit_delay", 0.15)),
         },
     }
 
 
+# 完成通知卡片骨架（与 json.dumps 生成的结构一致），header/content 填入 _json_dumps 转义后的 JSON 字符串
+_COMPLETED_CARD_TEMPLATE = (
+    '{{"config": {{"wide_screen_mode": true}}, '
+    '"header": {{"template": "green", "title": {{"tag": "plain_text", "content": {header}}}}}, '
+    '"elements": [{{"tag": "markdown", "content": {content}}}, {{"tag": "hr"}}, '
+    '{{"tag": "markdown", "content": "回复 **#terminal_id <指令>** 继续对话"}}]}}'
+)
+
+# ls -l 终端列表卡片骨架，同上
+_TERMINAL_LIST_CARD_TEMPLATE = (
+    '{{"config": {{"wide_screen_mode": true}}, '
+    '"header": {{"template": "blue", "title": {{"tag": "plain_text", "content": {header}}}}}, '
+    '"elements": [{{"tag": "markdown", "content": {content}}}]}}'
+)
+
 # ── 守护进程主体 ──────────────────────────────────────
 
 class FeishuBridgeDaemon:
@@ -212,12 +341,21 @@ class FeishuBridgeDaemon:
         self.poll_interval = bridge_cfg["poll_interval"]
         self.expire_seconds = bridge_cfg["expire_minutes"] * 60
         self.kitty_socket = self.config["kitty"]["socket"]
+        self._detected_socket: tuple[float, str] = (0.0, "")  # (缓存到期时间, socket)
         hub_cfg = self.config["hub"]
         self.cleanup_interval = hub_cfg["registry_cleanup_interval"]
         self.max_screen_lines = hub_cfg["max_screen_lines"]
         self.command_max_length = hub_cfg["command_max_length"]
+        self.submit_delay = hub_cfg["submit_delay"]
         self._pending_commands = {}  # {feishu_msg_id: {"terminal_id", "text", "timestamp"}}
+        self._pending_cmd_heap: list[tuple[float, str]] = []  # (timestamp, feishu_msg_id) 按时间过期
+        self._pending_cmd_lock = threading.Lock()
         self._running = True
+        self._stop_signal: int | None = None
+        # 自管道：信号处理器只置标志，由 set_wakeup_fd 写入一个字节唤醒主循环
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
         self._start_time = time.time()  # 守护进程启动时间
 
         # 允许接收消息的用户 open_id（只处理该用户的消息）
@@ -229,18 +367,44 @@ class FeishuBridgeDaemon:
         # API 轮询兜底（降低 WebSocket 固有延迟）
         self.poll_api_interval = int(bridge_cfg.get("poll_api_interval", 2))
         self._chat_id = feishu_cfg.get("chat_id", "")  # P2P 聊天 ID，可自动捕获
-        self._seen_msgs: dict[str, float] = {}  # {message_id: timestamp} 去重
+        # {message_id: timestamp} 去重，按插入（即时间）顺序排列
+        self._seen_msgs: OrderedDict[str, float] = OrderedDict()
         self._seen_lock = threading.Lock()
+        # WebSocket / 轮询收到的消息统一入队，由单个工作线程按到达顺序处理
+        self._reply_queue: queue.Queue[tuple[str, str, int]] = queue.Queue(maxsize=REPLY_QUEUE_SIZE)
+        # 含 kitty IPC 的后台任务复用固定线程池，突发消息时不再逐条新建线程
+        self._pool = ThreadPoolExecutor(max_workers=SEND_POOL_WORKERS, thread_name_prefix="fb")
+        self._submit = self._pool.submit
+        # 纯飞书发送（错误提示、详情卡片等）交给单个发送线程按序执行，不占用线程池
+        self._outbox: queue.SimpleQueue[tuple] = queue.SimpleQueue()
+
+        # pending 文件内存索引：{filepath: pending}，由 inotify 事件增量维护
+        self._pending: dict[str, dict] = {}
+        self._pending_mtimes: dict[str, int] = {}  # {filepath: st_mtime_ns}，全量扫描时跳过未变文件
+        self._by_msg_id: dict[str, str] = {}  # {feishu_msg_id: filepath}，回复卡片时 O(1) 定位
+        self._by_terminal: dict[str, str] = {}  # {terminal_id: filepath}，#terminal_id 指令 O(1) 定位
+        self._by_window: dict[str, set[str]] = {}  # {window_id: {filepath}}，兼容旧格式 #window_id（跨实例不唯一）
+        self._latest_notified: str | None = None  # 最新已通知的 pending（无 parent_id 回复时使用）
+        self._deadlines: list[tuple[float, str]] = []  # (到期时间, filepath) 小顶堆，惰性失效
+        # 保护上面几个索引：主循环与回复处理线程都会读写（可重入，便于辅助方法互相调用）
+        self._state_lock = threading.RLock()
+        self._inotify = None
 
     def run(self):
         """启动守护进程"""
         os.makedirs(STATE_DIR, exist_ok=True)
         self._write_pid()
+        self._init_watch()
 
-        # 注册信号处理
+        # 注册信号处理：处理器只置标志，清理在主循环退出后进行
+        signal.set_wakeup_fd(self._wake_w)
         signal.signal(signal.SIGTERM, self._handle_signal)
         signal.signal(signal.SIGINT, self._handle_signal)
 
+        # 启动消息处理线程（在 WebSocket 之前，避免首批消息积压）
+        threading.Thread(target=self._reply_worker, daemon=True).start()
+        threading.Thread(target=self._sender_loop, daemon=True).start()
+
         # 启动飞书 WebSocket 监听线程
         ws_thread = threading.Thread(
             target=self._ws_listener_safe, daemon=True
@@ -269,17 +433,46 @@ class FeishuBridgeDaemon:
         else:
             logger.info("API 轮询已禁用 (poll_api_interval=0)")
 
-        # 主循环：监控 pending 文件
-        self._monitor_loop()
+        # 主循环：监控 pending 文件，收到停止信号后返回
+        try:
+            self._monitor_loop()
+        finally:
+            if self._stop_signal is not None:
+                logger.info("收到信号 %d，正在停止...", self._stop_signal)
+            self._cleanup()
 
     def _ws_listener_safe(self):
-        """WebSocket 监听包装，异常后自动重试"""
+        """WebSocket 监听包装，异常后按指数退避（带抖动）重试"""
+        backoff = WS_BACKOFF_MIN
+        failing_since = None
+        fatal_logged = False
+        connect = self.feishu.start_ws_listener
         while self._running:
+            start = time.monotonic()
             try:
-                self.feishu.start_ws_listener(self._handle_reply)
+                connect(self._handle_reply)
+                logger.warning("WebSocket 监听退出，%.1f 秒后重连", backoff)
             except Exception:
-                logger.exception("WebSocket 监听异常，5 秒后重试")
-                time.sleep(5)
+                logger.exception("WebSocket 监听异常，%.1f 秒后重试", backoff)
+
+            now = time.monotonic()
+            if now - start > WS_STABLE_SECONDS:
+                # 连接稳定运行过一段时间，视为恢复
+                backoff = WS_BACKOFF_MIN
+                failing_since = None
+                fatal_logged = False
+            elif failing_since is None:
+                failing_since = start
+            elif not fatal_logged and now - failing_since > WS_FATAL_SECONDS:
+                logger.critical(
+                    "WebSocket 已连续失败 %.0f 分钟，请检查飞书配置/网络",
+                    (now - failing_since) / 60,
+                )
+                fatal_logged = True
+
+            time.sleep(backoff + random.uniform(0, backoff * 0.3))
+            backoff = min(backoff * 2, WS_BACKOFF_MAX)
+            connect = self.feishu.reconnect_ws
 
     # ── 消息去重 ──────────────────────────────────────────
 
@@ -289,15 +482,19 @@ class FeishuBridgeDaemon:
             if message_id in self._seen_msgs:
                 return False
             self._seen_msgs[message_id] = time.time()
+            if len(self._seen_msgs) > SEEN_MSGS_MAX:
+                self._seen_msgs.popitem(last=False)
             return True
 
     def _cleanup_seen_msgs(self):
-        """清理 5 分钟前的去重记录"""
-        cutoff = time.time() - 300
+        """清理过期的去重记录：从最早的一端弹出，遇到未过期的即停止"""
+        cutoff = time.time() - SEEN_MSGS_TTL
         with self._seen_lock:
-            expired = [k for k, v in self._seen_msgs.items() if v < cutoff]
-            for k in expired:
-                del self._seen_msgs[k]
+            while self._seen_msgs:
+                oldest = next(iter(self._seen_msgs.values()))
+                if oldest >= cutoff:
+                    break
+                self._seen_msgs.popitem(last=False)
 
     # ── API 轮询 ──────────────────────────────────────────
 
@@ -313,96 +510,340 @@ class FeishuBridgeDaemon:
         # 从当前时间开始轮询（秒级时间戳）
         last_time = str(int(time.time()))
 
+        chat_id = self._chat_id
+        allowed = self._allowed_user_id
         while self._running:
             try:
-                msgs = self.feishu.list_messages(self._chat_id, last_time, page_size=10)
+                # 发送者过滤下推到 list_messages，在解析消息内容前完成
+                msgs = self.feishu.list_messages(chat_id, last_time, page_size=10, sender_id=allowed)
                 for m in msgs:
-                    msg_id = m["message_id"]
-                    if not self._is_new_message(msg_id):
-                        continue
-                    # 过滤发送者
-                    if self._allowed_user_id and m.get("sender_id") != self._allowed_user_id:
+                    if not self._is_new_message(m["message_id"]):
                         continue
                     # 更新游标：用最新消息的 create_time（毫秒转秒 +1）
                     create_ts = m["create_time"]
                     if create_ts:
                         last_time = str(create_ts // 1000 + 1) if create_ts > 1e12 else str(create_ts + 1)
 
-                    self._process_reply(m["text"], m["parent_id"], create_ts)
+                    self._enqueue_reply(m["text"], m["parent_id"], create_ts)
             except Exception:
                 logger.exception("[轮询] 异常")
 
             time.sleep(self.poll_api_interval)
 
+    # ── pending 文件监控 ──────────────────────────────────
+
+    def _init_watch(self):
+        """订阅 STATE_DIR 的 inotify 事件；不可用时保持 None，主循环退回轮询"""
+        if INotify is None:
+            logger.info("inotify 不可用，pending 文件按 %ds 间隔轮询", self.poll_interval)
+            return
+        try:
+            self._inotify = INotify()
+            self._inotify.add_watch(
+                STATE_DIR,
+                inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+                | inotify_flags.DELETE | inotify_flags.MOVED_FROM,
+            )
+        except OSError:
+            logger.exception("inotify 初始化失败，退回轮询")
+            self._inotify = None
+
+    def _load_pending(self, filepath: str):
+        """读取单个 pending 文件到内存索引，文件不存在或损坏时移出索引"""
+        try:
+            with open(filepath, "rb") as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                pending = _json_loads(f.read())
+            if not isinstance(pending, dict):
+                raise ValueError("pending 内容不是 JSON 对象")
+            ts = pending.get("timestamp")
+            if ts is not None and not isinstance(ts, (int, float)):
+                raise ValueError(f"pending timestamp 非数值: {ts!r}")
+        except FileNotFoundError:
+            self._forget_pending(filepath)
+            return
+        except ValueError as e:  # 含 JSONDecodeError / UnicodeDecodeError
+            logger.warning("pending 文件无效，忽略: %s (%s)", filepath, e)
+            self._forget_pending(filepath)
+            return
+        except Exception:
+            logger.exception("读取 pending 文件异常: %s", filepath)
+            self._forget_pending(filepath)
+            return
+        with self._state_lock:
+            self._unindex_pending(filepath, self._pending.get(filepath))
+            self._pending[filepath] = pending
+            self._pending_mtimes[filepath] = mtime_ns
+            self._index_pending(filepath, pending)
+
+    def _index_pending(self, filepath: str, pending: dict):
+        """登记 feishu_msg_id、最新已通知 pending 的索引，并安排下一次检查时间"""
+        ts = pending.get("timestamp", time.time())
+        with self._state_lock:
+            if pending.get("notified"):
+                heapq.heappush(self._deadlines, (ts + self.expire_seconds, filepath))
+            else:
+                heapq.heappush(self._deadlines, (ts + self.wait_seconds, filepath))
+            msg_id = pending.get("feishu_msg_id")
+            if msg_id:
+                self._by_msg_id[msg_id] = filepath
+            terminal_id = pending.get("terminal_id")
+            if terminal_id:
+                self._by_terminal[terminal_id] = filepath
+            window_id = pending.get("window_id")
+            if window_id:
+                self._by_window.setdefault(window_id, set()).add(filepath)
+            if pending.get("notified"):
+                latest = self._pending.get(self._latest_notified or "")
+                if latest is None or pending.get("timestamp", 0) > latest.get("timestamp", 0):
+                    self._latest_notified = filepath
+
+    def _write_pending(self, filepath: str, pending: dict):
+        """原子写回 pending 文件：写临时文件后 rename，读者不会看到半截 JSON
+
+        临时文件以 .tmp 结尾，不会被当作 pending 扫描。写回后记录新 mtime，
+        随之而来的 inotify 事件 / 全量扫描发现 mtime 未变即跳过重新解析。
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=STATE_DIR, prefix=".pending-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_json_dumps_bytes(pending))
+                f.flush()
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            _safe_unlink(tmp_path)
+            raise
+        with self._state_lock:
+            if self._pending.get(filepath) is pending:
+                self._pending_mtimes[filepath] = mtime_ns
+
+    def _reload_pending_if_changed(self, filepath: str):
+        """inotify 通知的 pending 文件：mtime 与内存一致（daemon 自己刚写回）时不重新解析"""
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except FileNotFoundError:
+            self._forget_pending(filepath)
+            return
+        if self._pending_mtimes.get(filepath) == mtime_ns and filepath in self._pending:
+            return
+        self._load_pending(filepath)
+
+    def _unindex_pending(self, filepath: str, pending: dict | None):
+        if not pending:
+            return
+        msg_id = pending.get("feishu_msg_id")
+        if msg_id and self._by_msg_id.get(msg_id) == filepath:
+            del self._by_msg_id[msg_id]
+        terminal_id = pending.get("terminal_id")
+        if terminal_id and self._by_terminal.get(terminal_id) == filepath:
+            del self._by_terminal[terminal_id]
+        window_id = pending.get("window_id")
+        paths = self._by_window.get(window_id) if window_id else None
+        if paths is not None:
+            paths.discard(filepath)
+            if not paths:
+                del self._by_window[window_id]
+
+    def _forget_pending(self, filepath: str):
+        with self._state_lock:
+            self._unindex_pending(filepath, self._pending.pop(filepath, None))
+            self._pending_mtimes.pop(filepath, None)
+            if self._latest_notified == filepath:
+                self._latest_notified = None
+
+    def _discard_pending(self, filepath: str):
+        """删除 pending 文件并同步移出内存索引"""
+        with self._state_lock:
+            self._forget_pending(filepath)
+            _safe_unlink(filepath)
+
+    def _rescan_state_dir(self):
+        """全量扫描 STATE_DIR：启动、轮询模式、inotify 队列溢出时使用
+
+        一次 scandir 同时处理 pending 与 completed 文件，mtime 未变的 pending
+        直接复用已解析内容。pending 的 timestamp 在写文件前生成，mtime 只会更晚，
+        因此按 mtime 已超过过期时间的文件无需解析即可直接删除。
+        """
+        seen = set()
+        completed = []
+        expire_before_ns = int((time.time() - self.expire_seconds) * 1e9)
+        try:
+            with os.scandir(STATE_DIR) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.endswith(COMPLETED_SUFFIX):
+                        completed.append(entry.path)
+                        continue
+                    if not _is_pending_name(name):
+                        continue
+                    filepath = entry.path
+                    try:
+                        mtime_ns = entry.stat().st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+                    if mtime_ns <= expire_before_ns:
+                        logger.info("pending 已过期，清理: %s", filepath)
+                        self._discard_pending(filepath)
+                        continue
+                    seen.add(filepath)
+                    if (self._pending_mtimes.get(filepath) == mtime_ns
+                            and filepath in self._pending):
+                        continue
+                    self._load_pending(filepath)
+        except FileNotFoundError:
+            pass
+        with self._state_lock:
+            for filepath in list(self._pending):
+                if filepath not in seen:
+                    self._forget_pending(filepath)
+        for filepath in completed:
+            self._process_completed_safe(filepath)
+
+    def _process_completed_safe(self, filepath: str):
+        try:
+            self._process_completed(filepath)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception("处理 completed 文件异常: %s", filepath)
+
+    def _next_wakeup(self, now: float, next_cleanup: float) -> float:
+        """距离下一个需要处理的时间点（最早的通知/过期时间或注册表清理）的秒数"""
+        deadline = next_cleanup
+        with self._state_lock:
+            if self._deadlines and self._deadlines[0][0] < deadline:
+                deadline = self._deadlines[0][0]
+        return max(0.0, deadline - now)
+
+    def _pop_due_pending(self, now: float) -> list[str]:
+        """弹出所有已到期的 filepath（去重；已删除的文件直接丢弃）"""
+        due = []
+        with self._state_lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, filepath = heapq.heappop(self._deadlines)
+                if filepath in self._pending and filepath not in due:
+                    due.append(filepath)
+        return due
+
+    def _wait_for_changes(self, timeout: float):
+        """阻塞等待 STATE_DIR 变化、停止信号或超时，并把变化同步到内存索引"""
+        fds = [self._wake_r]
+        if self._inotify is not None:
+            fds.append(self._inotify.fileno())
+            # 多等 1ms，避免 deadline 前被提前唤醒后空转
+            timeout += 0.001
+        else:
+            timeout = self.poll_interval
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except InterruptedError:
+            readable = []
+        if self._wake_r in readable:
+            self._drain_wakeup()
+        if not self._running:
+            return
+
+        if self._inotify is None:
+            self._rescan_state_dir()
+            return
+        if self._inotify.fileno() not in readable:
+            return
+
+        events = self._inotify.read(timeout=0)
+        for event in events:
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                logger.warning("inotify 事件队列溢出，全量重新扫描")
+                self._rescan_state_dir()
+                continue
+            name = event.name
+            filepath = os.path.join(STATE_DIR, name)
+            removed = event.mask & (inotify_flags.DELETE | inotify_flags.MOVED_FROM)
+            if name.endswith(COMPLETED_SUFFIX):
+                if not removed:
+                    self._process_completed_safe(filepath)
+            elif _is_pending_name(name):
+                if removed:
+                    self._forget_pending(filepath)
+                else:
+                    self._reload_pending_if_changed(filepath)
+
     def _monitor_loop(self):
-        """主循环：扫描 pending 文件，超时发飞书通知，定期清理注册表"""
+        """主循环：等待 pending 文件变化，超时发飞书通知，定期清理注册表"""
         last_cleanup = 0
-        skip_files = {"daemon.pid", "registry.json"}
+        self._rescan_state_dir()
         while self._running:
             now = time.time()
-            # 处理 pending 权限文件
-            for filepath in glob.glob(os.path.join(STATE_DIR, "*.json")):
-                basename = os.path.basename(filepath)
-                if basename in skip_files:
-                    continue
-                # 跳过 _completed 后缀的文件（单独处理）
-                if basename.endswith("_completed.json"):
+            # 只处理到期的 pending（堆中条目可能已过时，_process_pending 会按实际时间判断）
+            for filepath in self._pop_due_pending(now):
+                pending = self._pending.get(filepath)
+                if pending is None:
                     continue
                 try:
-                    self._process_pending(filepath, now)
+                    self._process_pending(filepath, pending, now)
                 except Exception:
                     logger.exception("处理 pending 文件异常: %s", filepath)
 
-            # 处理完成通知文件（立即发送飞书通知）
-            for filepath in glob.glob(os.path.join(STATE_DIR, "*_completed.json")):
-                try:
-                    self._process_completed(filepath)
-                except Exception:
-                    logger.exception("处理 completed 文件异常: %s", filepath)
-
             # 定期维护注册表：扫描所有 kitty 实例 + 清理已关闭终端
+            # 每个 kitty 实例一次 `kitty @ ls`，放到线程池执行，不拖慢主循环对 inotify 事件的响应
             if now - last_cleanup >= self.cleanup_interval:
                 last_cleanup = now
-                scan_all_kitty()
-                removed = cleanup_all_kitty()
-                if removed:
-                    logger.info("注册表清理: 移除 %d 个终端", removed)
+                self._submit(self._refresh_registry)
                 # 清理过期的待确认指令（5 分钟）
-                expired = [k for k, v in self._pending_commands.items()
-                           if now - v["timestamp"] > 300]
-                for k in expired:
-                    del self._pending_commands[k]
+                self._expire_pending_commands(now)
                 # 清理消息去重记录
                 self._cleanup_seen_msgs()
 
-            time.sleep(self.poll_interval)
+            timeout = self._next_wakeup(time.time(), last_cleanup + self.cleanup_interval)
+            try:
+                self._wait_for_changes(timeout)
+            except Exception:
+                logger.exception("同步 pending 文件变化异常")
+                time.sleep(1)
+
+    def _expire_pending_commands(self, now: float):
+        """清理过期的待确认指令：只弹出堆顶已过期的条目，已确认的条目弹出时忽略"""
+        cutoff = now - PENDING_COMMAND_TTL
+        with self._pending_cmd_lock:
+            heap = self._pending_cmd_heap
+            while heap and heap[0][0] < cutoff:
+                _, msg_id = heapq.heappop(heap)
+                self._pending_commands.pop(msg_id, None)
 
     def _detect_socket(self) -> str:
-        """获取 kitty socket：配置 > 注册表 > 环境变量"""
+        """获取 kitty socket：配置 > 注册表 > 环境变量（探测结果缓存 SOCKET_DETECT_TTL 秒）"""
         if self.kitty_socket:
             return self.kitty_socket
+        now = time.monotonic()
+        expires, socket = self._detected_socket
+        if now < expires:
+            return socket
+        socket = ""
         # 从注册表中取第一个有效的 socket
-        registry = load_registry()
-        for info in registry.values():
-            s = info.get("kitty_socket", "")
-            if s:
-                return s
-        # 兜底：环境变量
-        return os.environ.get("KITTY_LISTEN_ON", "")
+        for info in load_registry().values():
+            socket = info.get("kitty_socket", "")
+            if socket:
+                break
+        else:
+            # 兜底：环境变量
+            socket = os.environ.get("KITTY_LISTEN_ON", "")
+        self._detected_socket = (now + SOCKET_DETECT_TTL, socket)
+        return socket
 
     def _detect_pending_mode(self, pending: dict) -> str:
         """识别 pending 类型：permission / text_input / selection"""
         mode = pending.get("reply_mode")
-        if mode in ("permission", "text_input", "selection"):
+        if mode in REPLY_MODES:
             return mode
 
-        message = str(pending.get("message", "")).strip().lower()
-        screen_tail = str(pending.get("screen_tail", "")).strip().lower()
+        # 子串查找走 C 层 fastsearch，比正则多选一分支更快；strip() 对包含判断无意义，省去一次拷贝
+        screen_tail = str(pending.get("screen_tail", "")).lower()
 
         # 选择弹窗优先检测（屏幕含 "Enter to select · ↑/↓ to navigate"）
         if any(k in screen_tail for k in SELECTION_SCREEN_HINTS):
             return "selection"
 
+        message = str(pending.get("message", "")).lower()
         if any(k in message for k in TEXT_INPUT_MESSAGE_HINTS):
             return "text_input"
         if any(k in message for k in PERMISSION_MESSAGE_HINTS):
@@ -416,52 +857,52 @@ class FeishuBridgeDaemon:
 
     def _find_pending_request(self, parent_id: str = "") -> tuple[str | None, dict | None]:
         """按 parent_id 精确定位 pending；无 parent_id 时返回最新 notified 的 pending"""
-        skip_files = {"daemon.pid", "registry.json"}
-        pattern = os.path.join(STATE_DIR, "*.json")
-        matched_file = None
-        matched_pending = None
-        latest_ts = 0
+        with self._state_lock:
+            return self._find_pending_request_locked(parent_id)
 
-        for filepath in glob.glob(pattern):
-            basename = os.path.basename(filepath)
-            if basename in skip_files or basename.endswith("_completed.json"):
-                continue
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    pending = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                continue
-
-            if parent_id and pending.get("feishu_msg_id") == parent_id:
+    def _find_pending_request_locked(self, parent_id: str) -> tuple[str | None, dict | None]:
+        if parent_id:
+            filepath = self._by_msg_id.get(parent_id)
+            pending = self._pending.get(filepath) if filepath else None
+            # 同一终端的 pending 文件可能已被 hook 重写，msg_id 不再对应
+            if pending is not None and pending.get("feishu_msg_id") == parent_id:
                 return filepath, pending
+            return None, None
+
+        filepath = self._latest_notified
+        pending = self._pending.get(filepath) if filepath else None
+        if pending is not None and pending.get("notified"):
+            return filepath, pending
 
-            if not parent_id and pending.get("notified"):
+        # 索引失效（最新一条已处理或被重写），在内存中重新挑选
+        matched_file = None
+        matched_pending = None
+        latest_ts = 0
+        for filepath, pending in self._pending.items():
+            if pending.get("notified"):
                 ts = pending.get("timestamp", 0)
                 if ts > latest_ts:
                     latest_ts = ts
                     matched_file = filepath
                     matched_pending = pending
-
+        self._latest_notified = matched_file
         return matched_file, matched_pending
 
     def _find_pending_by_terminal(self, selector: str) -> tuple[str | None, dict | None]:
         """通过 terminal_id（或兼容的 window_id）精确查找已通知的 pending 文件"""
-        skip_files = {"daemon.pid", "registry.json"}
-        pattern = os.path.join(STATE_DIR, "*.json")
-        for filepath in glob.glob(pattern):
-            basename = os.path.basename(filepath)
-            if basename in skip_files or basename.endswith("_completed.json"):
-                continue
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    pending = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                continue
-            pending_terminal_id = pending.get("terminal_id")
-            if pending.get("notified") and (
-                pending_terminal_id == selector or pending.get("window_id") == selector
-            ):
+        with self._state_lock:
+            filepath = self._by_terminal.get(selector)
+            pending = self._pending.get(filepath) if filepath else None
+            if pending is not None and pending.get("notified"):
                 return filepath, pending
+            if "@" in selector:
+                # 完整 terminal_id 未命中索引，不可能再按 window_id 匹配
+                return None, None
+            # 兼容旧格式 #window_id：window_id 在多个 kitty 实例间不唯一，只在同号的几个里找
+            for filepath in self._by_window.get(selector, ()):
+                pending = self._pending.get(filepath)
+                if pending is not None and pending.get("notified"):
+                    return filepath, pending
         return None, None
 
     @staticmethod
@@ -480,14 +921,32 @@ class FeishuBridgeDaemon:
                 f"- #{self._terminal_display_id(item)}  {item.get('tab_title') or item.get('cwd') or '?'}"
                 for item in ambiguous
             )
-            self.feishu.send_text_message(
+            self._post(
+                self.feishu.send_text_message,
                 f"⚠️ 终端 #{selector} 不唯一，请使用完整 terminal_id：\n{suggestions}"
             )
             return None
 
-        self.feishu.send_text_message(f"❌ 终端 #{selector} 不存在或已关闭")
+        self._post(self.feishu.send_text_message, f"❌ 终端 #{selector} 不存在或已关闭")
         return None
 
+    def _socket_or_reply(self, info: dict) -> str:
+        """取终端的 kitty socket，取不到时回复用户并返回空串"""
+        socket = info.get("kitty_socket") or self._detect_socket()
+        if not socket:
+            self._post(self.feishu.send_text_message, "❌ 无法连接 kitty 终端")
+        return socket
+
+    def _resolve_window(self, selector: str) -> tuple[dict | None, str]:
+        """解析终端及其 kitty socket；任一步失败时已回复用户，返回 (None, "")"""
+        info = self._resolve_terminal_or_reply(selector)
+        if not info:
+            return None, ""
+        socket = self._socket_or_reply(info)
+        if not socket:
+            return None, ""
+        return info, socket
+
     def _handle_parent_reply(self, text: str, parent_id: str) -> bool:
         """处理回复链中的消息（优先于普通命令解析）"""
         if not parent_id:
@@ -496,10 +955,10 @@ class FeishuBridgeDaemon:
         # 终端指令确认（#terminal_id 文本在忙碌状态时触发）
         if parent_id in self._pending_commands:
             lower = text.lower()
-            if lower in ("y", "n", "yes", "no", "是", "否"):
+            if lower in PERMISSION_REPLIES:
                 self._execute_pending_command(lower, parent_id)
             else:
-                self.feishu.reply_message(parent_id, "⚠️ 该确认仅支持回复 y 或 n")
+                self._post(self.feishu.reply_message, parent_id, "⚠️ 该确认仅支持回复 y 或 n")
             return True
 
         matched_file, matched_pending = self._find_pending_request(parent_id)
@@ -517,24 +976,16 @@ class FeishuBridgeDaemon:
         # ── 文本输入 ──
         if mode == "text_input":
             if text.lower() in TEXT_INPUT_CANCEL_WORDS:
-                try:
-                    os.remove(matched_file)
-                except FileNotFoundError:
-                    pass
-                self.feishu.reply_message(parent_id, "❌ 已取消本次输入")
+                self._discard_pending(matched_file)
+                self._post(self.feishu.reply_message, parent_id, "❌ 已取消本次输入")
                 logger.info("取消文本输入: window=%s", matched_pending.get("window_id"))
                 return True
 
             socket = matched_pending.get("kitty_socket") or self.kitty_socket
             wid = matched_pending["window_id"]
-            send_keystroke(wid, text, socket)
-            time.sleep(0.15)
-            send_keystroke(wid, "\r", socket)
-            try:
-                os.remove(matched_file)
-            except FileNotFoundError:
-                pass
-            self.feishu.reply_message(parent_id, "✅ 已发送文本到终端")
+            send_text_and_enter(wid, text, socket, self.submit_delay)
+            self._discard_pending(matched_file)
+            self._post(self.feishu.reply_message, parent_id, "✅ 已发送文本到终端")
             logger.info(
                 "文本输入完成: window=%s, text=%s",
                 matched_pending["window_id"],
@@ -544,26 +995,20 @@ class FeishuBridgeDaemon:
 
         # ── 权限确认 y/n ──
         lower = text.lower()
-        if lower in ("y", "n", "yes", "no", "是", "否"):
+        if lower in PERMISSION_REPLIES:
             self._handle_permission_reply(lower, parent_id)
         else:
-            self.feishu.reply_message(parent_id, "⚠️ 该请求是权限确认，请回复 y 或 n")
+            self._post(self.feishu.reply_message, parent_id, "⚠️ 该请求是权限确认，请回复 y 或 n")
         return True
 
-    def _process_pending(self, filepath: str, now: float):
-        """处理单个 pending 文件"""
-        with open(filepath, "r", encoding="utf-8") as f:
-            pending = json.load(f)
-
+    def _process_pending(self, filepath: str, pending: dict, now: float):
+        """处理单个 pending 文件（内容来自内存索引）"""
         age = now - pending.get("timestamp", now)
 
         # 超过过期时间 → 清理
         if age >= self.expire_seconds:
-            logger.info(
-                "pending 已过期 (%d 秒)，清理: %s",
-                int(age), filepath,
-            )
-            os.remove(filepath)
+            logger.info("pending 已过期 (%.0f 秒)，清理: %s", age, filepath)
+            self._discard_pending(filepath)
             return
 
         # 超过等待时间且未通知 → 发飞书
@@ -576,26 +1021,35 @@ class FeishuBridgeDaemon:
                 parsed = parse_selection_screen(screen)
                 pending["options"] = parsed["options"]
                 pending["option_count"] = len(parsed["options"])
-                pending["text_input_options"] = list(parsed["text_input_indices"])
+                pending["text_input_mask"] = parsed["text_input_mask"]
                 pending["question"] = parsed["question"]
                 pending["descriptions"] = parsed["descriptions"]
 
-            logger.info(
-                "超过等待时间 (%d 秒)，发送飞书通知: window=%s, mode=%s",
-                int(age), pending.get("window_id"),
-                pending["reply_mode"],
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "超过等待时间 (%.0f 秒)，发送飞书通知: window=%s, mode=%s",
+                    age, pending.get("window_id"),
+                    pending["reply_mode"],
+                )
             msg_id = self.feishu.send_permission_message(pending)
             if msg_id:
                 pending["feishu_msg_id"] = msg_id
                 pending["notified"] = True
-                with open(filepath, "w", encoding="utf-8") as f:
-                    json.dump(pending, f, ensure_ascii=False, indent=2)
+                # 卡片已发出、选项已解析，写回时只保留屏幕末尾几行，缩小后续读写的 JSON
+                pending["screen_tail"] = _trim_screen_tail(
+                    pending.get("screen_tail", ""), self.max_screen_lines
+                )
+                self._index_pending(filepath, pending)
+                self._write_pending(filepath, pending)
+            else:
+                # 发送失败，按轮询间隔重试
+                with self._state_lock:
+                    heapq.heappush(self._deadlines, (now + self.poll_interval, filepath))
 
     def _process_completed(self, filepath: str):
         """处理完成通知文件：发送飞书通知后删除文件"""
-        with open(filepath, "r", encoding="utf-8") as f:
-            completed = json.load(f)
+        with open(filepath, "rb") as f:
+            completed = _json_loads(f.read())
 
         window_id = completed.get("terminal_id") or completed.get("window_id", "?")
         tab_title = completed.get("tab_title", "")
@@ -615,28 +1069,20 @@ class FeishuBridgeDaemon:
             lines = [l for l in screen_tail.strip().split("\n") if l.strip()]
             content = "\n".join(lines[-30:]) if lines else "(无内容)"
 
-        # 飞书卡片发送
-        card = json.dumps({
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "template": "green",
-                "title": {"tag": "plain_text", "content": header},
-            },
-            "elements": [
-                {"tag": "markdown", "content": f"```\n{content}\n```"},
-                {"tag": "hr"},
-                {"tag": "markdown", "content": "回复 **#terminal_id <指令>** 继续对话"},
-            ],
-        }, ensure_ascii=False)
+        # 飞书卡片发送：固定骨架，只对两处变量做字符串转义
+        card = _COMPLETED_CARD_TEMPLATE.format(
+            header=_json_dumps(header),
+            content=_json_dumps(f"```\n{content}\n```"),
+        )
 
         self.feishu._send_card(card)
         logger.info("发送完成通知: terminal=%s, lines=%d", window_id, len(lines))
 
         # 删除完成通知文件
-        os.remove(filepath)
+        _safe_unlink(filepath)
 
     def _handle_reply(self, data):
-        """飞书消息回调：立即派发到线程，不阻塞 asyncio 事件循环
+        """飞书消息回调：入队后立即返回，不阻塞 asyncio 事件循环
 
         Lark SDK 在 asyncio 事件循环中同步调用此回调，回调返回后才发 ACK。
         如果回调阻塞（文件 I/O、HTTP），会延迟 ACK → 服务端流控 → 下一条消息推送延迟。
@@ -652,8 +1098,7 @@ class FeishuBridgeDaemon:
             if self._allowed_user_id and sender_id != self._allowed_user_id:
                 return
 
-            content = json.loads(msg.content) if msg.content else {}
-            text = content.get("text", "").strip()
+            text = extract_text(msg.content).strip()
             if not text:
                 return
 
@@ -668,19 +1113,25 @@ class FeishuBridgeDaemon:
                 logger.debug("[WebSocket] 跳过已处理消息: %s", message_id)
                 return
 
-            # 轻量提取后立即派发，让 SDK 尽快发 ACK
-            parent_id = msg.parent_id
-            create_time = int(msg.create_time or 0)
-            threading.Thread(
-                target=self._process_reply,
-                args=(text, parent_id, create_time),
-                daemon=True,
-            ).start()
+            # 轻量提取后立即入队，让 SDK 尽快发 ACK
+            self._enqueue_reply(text, msg.parent_id, int(msg.create_time or 0))
         except Exception:
             logger.exception("消息回调预处理异常")
 
+    def _enqueue_reply(self, text: str, parent_id: str, create_time: int):
+        try:
+            self._reply_queue.put_nowait((text, parent_id, create_time))
+        except queue.Full:
+            logger.error("消息队列已满 (%d)，丢弃消息: text=%s", REPLY_QUEUE_SIZE, text[:50])
+
+    def _reply_worker(self):
+        """消息处理线程：复用同一线程，避免每条消息新建线程；同一用户的操作按顺序执行"""
+        while True:
+            text, parent_id, create_time = self._reply_queue.get()
+            self._process_reply(text, parent_id, create_time)
+
     def _process_reply(self, text: str, parent_id: str, create_time: int):
-        """在独立线程中处理飞书消息（不阻塞 asyncio 事件循环）"""
+        """在消息处理线程中处理飞书消息（不阻塞 asyncio 事件循环）"""
         try:
             now = time.time()
             # 计算端到端延迟（消息创建 → 实际处理）
@@ -695,8 +1146,9 @@ class FeishuBridgeDaemon:
                         text[:50], delay, self.max_message_age,
                     )
                     return
-                logger.info("收到飞书消息: text=%s, parent_id=%s, 延迟=%.1fs", text, parent_id, delay)
-            else:
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("收到飞书消息: text=%s, parent_id=%s, 延迟=%.1fs", text, parent_id, delay)
+            elif logger.isEnabledFor(logging.INFO):
                 logger.info("收到飞书消息: text=%s, parent_id=%s", text, parent_id)
 
             # 先处理回复链消息
@@ -712,11 +1164,13 @@ class FeishuBridgeDaemon:
                 self._handle_list_terminals(cmd.get("detail", False))
             elif cmd_type == "permission_reply":
                 # 安全规则：standalone y/n 必须回复卡片或用 #terminal_id 前缀
-                self.feishu.send_text_message(
+                self._post(
+                    self.feishu.send_text_message,
                     "⚠️ 请**回复对应卡片**或指定终端 **#terminal_id y** / **#terminal_id n**"
                 )
             elif cmd_type == "help":
-                self.feishu.send_text_message(
+                self._post(
+                    self.feishu.send_text_message,
                     "📖 **指令速查**\n\n"
                     "**查看**\n"
                     "　**ls**　终端列表　|　**ls -l**　含屏幕预览\n"
@@ -743,14 +1197,50 @@ class FeishuBridgeDaemon:
         except Exception:
             logger.exception("处理飞书消息异常")
 
+    def _post(self, fn, *args):
+        """把一次飞书调用放进发送队列，立即返回"""
+        self._outbox.put((fn, args))
+
+    def _sender_loop(self):
+        """飞书发送线程：逐个执行队列中的调用
+
+        发送期间陆续排队的连续回执合并为一条消息，且与其他回复保持入队顺序。
+        """
+        item = None
+        while True:
+            fn, args = item or self._outbox.get()
+            item = None
+            if fn is _ACK:
+                batch = list(args)
+                size = len(batch[0])
+                while size < ACK_BATCH_MAX_BYTES:
+                    try:
+                        item = self._outbox.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item[0] is not _ACK:
+                        break
+                    batch.extend(item[1])
+                    size += len(item[1][0])
+                    item = None
+                fn, args = self.feishu.send_text_message, ("\n".join(batch),)
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("飞书消息发送异常")
+
+    def _ack(self, text: str):
+        """发送操作回执（经发送队列合并发送，不阻塞调用方）"""
+        self._outbox.put((_ACK, (text,)))
+
     # ── 指令处理方法 ──────────────────────────────────
 
     def _reply_or_send(self, parent_id: str, text: str):
         """有 parent_id 时回复消息，否则发送新消息"""
         if parent_id:
-            self.feishu.reply_message(parent_id, text)
+            self._post(self.feishu.reply_message, parent_id, text)
         else:
-            self.feishu.send_text_message(text)
+            self._post(self.feishu.send_text_message, text)
 
     def _handle_selection_reply(
         self, text: str, parent_id: str, matched_file: str, matched_pending: dict
@@ -770,20 +1260,16 @@ class FeishuBridgeDaemon:
         text = text.strip()
 
         # 支持 Esc 取消
-        if text.lower() in ("esc", "取消", "cancel"):
+        if text.lower() in SELECTION_CANCEL_WORDS:
             socket = matched_pending.get("kitty_socket") or self.kitty_socket
             send_key(matched_pending["window_id"], "escape", socket)
-            try:
-                os.remove(matched_file)
-            except FileNotFoundError:
-                pass
+            self._discard_pending(matched_file)
             self._reply_or_send(parent_id, "❌ 已取消选择")
             logger.info("取消选择: window=%s", matched_pending.get("window_id"))
             return True
 
         # 解析 "N" 或 "N 文本"
-        import re
-        m = re.match(r"^(\d+)\s*(.*)", text)
+        m = _NUMERIC_PREFIX_RE.match(text)
         if not m:
             option_count = matched_pending.get("option_count", 0)
             hint = f"1-{option_count}" if option_count else "1、2、3..."
@@ -806,17 +1292,20 @@ class FeishuBridgeDaemon:
             )
             return True
 
-        text_input_options = set(matched_pending.get("text_input_options", []))
+        text_input_mask = matched_pending.get("text_input_mask")
+        if text_input_mask is None:
+            # 旧版本写入的序号列表
+            text_input_mask = sum(1 << i for i in set(matched_pending.get("text_input_options", [])))
         socket = matched_pending.get("kitty_socket") or self.kitty_socket
         wid = matched_pending["window_id"]
 
         # 选项 1 已选中（光标默认在第一项），直接 Enter
-        # 选项 N → 发送 (N-1) 个 Down 箭头
-        for _ in range(choice - 1):
-            send_key(wid, "down", socket)
+        # 选项 N → 一次调用发送 (N-1) 个 Down 箭头
+        if choice > 1:
+            send_keys(wid, ["down"] * (choice - 1), socket)
             time.sleep(0.05)
 
-        if choice in text_input_options:
+        if text_input_mask >> choice & 1:
             if extra_text:
                 # 一步完成：导航到位 → 直接输入文字 → Enter
                 time.sleep(0.1)
@@ -828,8 +1317,7 @@ class FeishuBridgeDaemon:
                 time.sleep(0.1)
                 matched_pending["reply_mode"] = "text_input"
                 matched_pending["notified"] = True
-                with open(matched_file, "w", encoding="utf-8") as f:
-                    json.dump(matched_pending, f, ensure_ascii=False, indent=2)
+                self._write_pending(matched_file, matched_pending)
                 options = matched_pending.get("options", [])
                 opt_name = options[choice - 1] if choice <= len(options) else f"选项 {choice}"
                 self._reply_or_send(
@@ -841,10 +1329,7 @@ class FeishuBridgeDaemon:
         else:
             send_key(wid, "enter", socket)
 
-        try:
-            os.remove(matched_file)
-        except FileNotFoundError:
-            pass
+        self._discard_pending(matched_file)
 
         # 获取选项文本
         options = matched_pending.get("options", [])
@@ -870,24 +1355,17 @@ class FeishuBridgeDaemon:
 
         if mode == "text_input":
             wid = matched_pending["window_id"]
-            send_keystroke(wid, answer, socket)
-            time.sleep(0.15)
-            send_keystroke(wid, "\r", socket)
+            send_text_and_enter(wid, answer, socket, self.submit_delay)
             action = "✅ 已发送文本"
         else:
-            is_allow = answer in ("y", "yes", "是")
-            keystroke = "\r" if is_allow else "\x1b"
+            _, keystroke, action = PERMISSION_REPLIES[answer]
             send_keystroke(matched_pending["window_id"], keystroke, socket)
-            action = "✅ 已允许" if is_allow else "❌ 已拒绝"
 
-        try:
-            os.remove(matched_file)
-        except FileNotFoundError:
-            pass
+        self._discard_pending(matched_file)
 
         reply_to = parent_id or matched_pending.get("feishu_msg_id", "")
         if reply_to:
-            self.feishu.reply_message(reply_to, action)
+            self._post(self.feishu.reply_message, reply_to, action)
 
         logger.info(
             "pending 回复完成: window=%s, mode=%s, action=%s",
@@ -908,79 +1386,72 @@ class FeishuBridgeDaemon:
 
         if detail:
             # ls -l: 先发"正在抓取"，后台异步抓取每个终端内容
-            self.feishu.send_text_message(f"⏳ 正在抓取 {len(terminals)} 个终端内容...")
-            threading.Thread(
-                target=self._send_terminal_list_detail,
-                args=(terminals,),
-                daemon=True,
-            ).start()
+            self._post(self.feishu.send_text_message, f"⏳ 正在抓取 {len(terminals)} 个终端内容...")
+            self._submit(self._send_terminal_list_detail, terminals)
         else:
-            self.feishu.send_terminal_list(terminals)
+            self._post(self.feishu.send_terminal_list, terminals)
             logger.info("发送终端列表: %d 个终端", len(terminals))
 
         # 后台刷新注册表
-        threading.Thread(target=self._refresh_registry, daemon=True).start()
+        self._submit(self._refresh_registry)
 
     def _send_terminal_list_detail(self, terminals: List):
         """后台抓取每个终端内容并发送详细列表"""
-        import re
-        results = []
-        for t in terminals:
+        # kitty get-text 一次只能取一个窗口，无法合并成单次调用；
+        # 兜底 socket 只探测一次，避免每个终端重复读注册表
+        fallback_socket = "" if all(t.get("kitty_socket") for t in terminals) else self._detect_socket()
+
+        def scrape(t: dict) -> dict | None:
             wid = t.get("window_id")
             terminal_id = t.get("terminal_id") or wid
-            socket = t.get("kitty_socket") or self._detect_socket()
+            socket = t.get("kitty_socket") or fallback_socket
             if not socket:
-                continue
+                return None
             # 抓取最后 5 行
             screen = get_terminal_screen(wid, socket, 5)
             # 清理控制字符，只保留可见字符
-            screen = re.sub(r"[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f]", "", screen)
+            screen = _CONTROL_CHARS_RE.sub("", screen)
             lines = [l for l in screen.strip().split("\n") if l.strip()][-5:]
             preview = "\n".join(lines) if lines else "(无内容)"
-            results.append({"terminal_id": terminal_id, "preview": preview})
+            return {"terminal_id": terminal_id, "preview": preview}
+
+        # 每个终端一次 kitty IPC，并发抓取：总耗时约为单次往返而非 N 倍
+        preview_by_id: dict[str, str] = {}
+        if terminals:
+            with ThreadPoolExecutor(max_workers=min(16, len(terminals))) as ex:
+                futures = [ex.submit(scrape, t) for t in terminals]
+                for future in as_completed(futures):
+                    result = future.result()
+                    if result:
+                        preview_by_id[result["terminal_id"]] = result["preview"]
 
         # 发送详细列表
-        registry = load_registry()
         lines = []
         claude_only = all((t.get("agent_kind") or "claude") == "claude" for t in terminals)
         for t in terminals:
             wid = t.get("terminal_id") or t.get("window_id")
-            icon = "🟢" if t.get("status") == "working" else "🔴" if t.get("status") == "completed" else "⚪"
+            icon = STATUS_ICONS.get(t.get("status"), "⚪")
             title = t.get("tab_title") or t.get("cwd", "").split("/")[-1] or "?"
             agent_name = t.get("agent_name") or "Claude"
             agent_prefix = "" if agent_name == "Claude" else f"[{agent_name}] "
-            # 找 preview
-            preview = ""
-            for r in results:
-                if r["terminal_id"] == wid:
-                    preview = r["preview"]
-                    break
+            preview = preview_by_id.get(wid, "")
             lines.append(f"{icon} **#{wid}** {agent_prefix}{title}")
             if preview:
                 lines.append(f"```\n{preview}\n```")
 
-        body = "\n".join(lines)
-        card = json.dumps({
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "template": "blue",
-                "title": {
-                    "tag": "plain_text",
-                    "content": f"📋 {'Claude' if claude_only else 'AI'} 终端列表（{len(terminals)} 个）",
-                },
-            },
-            "elements": [
-                {"tag": "markdown", "content": body},
-            ],
-        }, ensure_ascii=False)
-        self.feishu._send_card(card)
+        card = _TERMINAL_LIST_CARD_TEMPLATE.format(
+            header=_json_dumps(f"📋 {'Claude' if claude_only else 'AI'} 终端列表（{len(terminals)} 个）"),
+            content=_json_dumps("\n".join(lines)),
+        )
+        self._post(self.feishu._send_card, card)
         logger.info("发送详细终端列表: %d 个终端", len(terminals))
 
     def _refresh_registry(self):
         """后台刷新注册表"""
         try:
-            scan_all_kitty()
-            cleanup_all_kitty()
+            _, removed = scan_and_cleanup_all_kitty()
+            if removed:
+                logger.info("注册表清理: 移除 %d 个终端", removed)
         except Exception:
             logger.debug("后台刷新注册表异常")
 
@@ -995,80 +1466,48 @@ class FeishuBridgeDaemon:
         def do_send():
             self.feishu.send_terminal_detail(info)
             logger.info("发送终端详情: terminal=%s", display_id)
-        threading.Thread(target=do_send, daemon=True).start()
+        self._post(do_send)
 
     def _handle_terminal_screen(self, selector: str):
         """处理终端进度/屏幕查看（异步）"""
-        info = self._resolve_terminal_or_reply(selector)
+        info, socket = self._resolve_window(selector)
         if not info:
             return
 
         display_id = self._terminal_display_id(info, selector)
         target_window_id = info.get("window_id", selector)
-        socket = info.get("kitty_socket") or self._detect_socket()
-        if not socket:
-            threading.Thread(
-                target=self.feishu.send_text_message,
-                args=("❌ 无法连接 kitty 终端",),
-                daemon=True,
-            ).start()
-            return
 
         def do_send():
             screen = get_terminal_screen(target_window_id, socket, self.max_screen_lines)
             self.feishu.send_terminal_screen(display_id, screen)
             logger.info("发送终端屏幕: terminal=%s", display_id)
-        threading.Thread(target=do_send, daemon=True).start()
+        self._submit(do_send)
 
     def _handle_terminal_key(self, selector: str, key: str):
         """处理向终端发送键盘事件"""
-        info = self._resolve_terminal_or_reply(selector)
+        info, socket = self._resolve_window(selector)
         if not info:
             return
 
         display_id = self._terminal_display_id(info, selector)
         target_window_id = info.get("window_id", selector)
-        socket = info.get("kitty_socket") or self._detect_socket()
-        if not socket:
-            threading.Thread(
-                target=self.feishu.send_text_message,
-                args=("❌ 无法连接 kitty 终端",),
-                daemon=True,
-            ).start()
-            return
 
         send_key(target_window_id, key, socket)
         logger.info("发送键盘事件: terminal=%s, key=%s", display_id, key)
-        threading.Thread(
-            target=self.feishu.send_text_message,
-            args=(f"✅ 已发送 {key} 到终端 #{display_id}",),
-            daemon=True,
-        ).start()
+        self._ack(f"✅ 已发送 {key} 到终端 #{display_id}")
 
     def _handle_terminal_clear(self, selector: str):
         """处理清屏指令"""
-        info = self._resolve_terminal_or_reply(selector)
+        info, socket = self._resolve_window(selector)
         if not info:
             return
 
         display_id = self._terminal_display_id(info, selector)
         target_window_id = info.get("window_id", selector)
-        socket = info.get("kitty_socket") or self._detect_socket()
-        if not socket:
-            threading.Thread(
-                target=self.feishu.send_text_message,
-                args=("❌ 无法连接 kitty 终端",),
-                daemon=True,
-            ).start()
-            return
 
         clear_screen(target_window_id, socket)
         logger.info("清屏: terminal=%s", display_id)
-        threading.Thread(
-            target=self.feishu.send_text_message,
-            args=(f"✅ 已清空终端 #{display_id} 屏幕",),
-            daemon=True,
-        ).start()
+        self._ack(f"✅ 已清空终端 #{display_id} 屏幕")
 
     def _handle_terminal_command(self, selector: str, text: str):
         """处理向终端发送指令
@@ -1088,40 +1527,28 @@ class FeishuBridgeDaemon:
                 )
             elif mode == "text_input":
                 if text.lower() in TEXT_INPUT_CANCEL_WORDS:
-                    try:
-                        os.remove(pending_file)
-                    except FileNotFoundError:
-                        pass
-                    self.feishu.send_text_message(f"❌ 已取消终端 #{display_id} 的输入")
+                    self._discard_pending(pending_file)
+                    self._post(self.feishu.send_text_message, f"❌ 已取消终端 #{display_id} 的输入")
                     return
                 socket = pending_data.get("kitty_socket") or self.kitty_socket
-                send_keystroke(target_window_id, text, socket)
-                time.sleep(0.15)
-                send_keystroke(target_window_id, "\r", socket)
-                try:
-                    os.remove(pending_file)
-                except FileNotFoundError:
-                    pass
-                self.feishu.send_text_message(f"✅ 已发送文本到终端 #{display_id}")
+                send_text_and_enter(target_window_id, text, socket, self.submit_delay)
+                self._discard_pending(pending_file)
+                self._post(self.feishu.send_text_message, f"✅ 已发送文本到终端 #{display_id}")
                 logger.info("文本输入（#terminal_id）: terminal=%s, text=%s", display_id, text[:60])
                 return
             elif mode == "permission":
                 lower = text.lower()
-                if lower in ("y", "n", "yes", "no", "是", "否"):
-                    is_allow = lower in ("y", "yes", "是")
+                if lower in PERMISSION_REPLIES:
+                    _, keystroke, action = PERMISSION_REPLIES[lower]
                     socket = pending_data.get("kitty_socket") or self.kitty_socket
-                    keystroke = "\r" if is_allow else "\x1b"
                     send_keystroke(target_window_id, keystroke, socket)
-                    action = "✅ 已允许" if is_allow else "❌ 已拒绝"
-                    try:
-                        os.remove(pending_file)
-                    except FileNotFoundError:
-                        pass
-                    self.feishu.send_text_message(f"{action} 终端 #{display_id}")
+                    self._discard_pending(pending_file)
+                    self._post(self.feishu.send_text_message, f"{action} 终端 #{display_id}")
                     logger.info("权限回复（#terminal_id）: terminal=%s, action=%s", display_id, action)
                     return
                 else:
-                    self.feishu.send_text_message(
+                    self._post(
+                        self.feishu.send_text_message,
                         f"⚠️ 终端 #{display_id} 等待权限确认，请发送 **#{display_id} y** 或 **#{display_id} n**"
                     )
                     return
@@ -1134,17 +1561,13 @@ class FeishuBridgeDaemon:
         display_id = self._terminal_display_id(info, selector)
 
         if len(text) > self.command_max_length:
-            threading.Thread(
-                target=self.feishu.send_text_message,
-                args=(f"⚠️ 指令过长（最大 {self.command_max_length} 字符）",),
-                daemon=True,
-            ).start()
+            self._post(self.feishu.send_text_message, f"⚠️ 指令过长（最大 {self.command_max_length} 字符）")
             logger.warning("指令过长: terminal=%s, len=%d", display_id, len(text))
             return
 
         # 忙碌状态 → 发确认消息（异步），暂存指令
         status = info.get("status", "idle")
-        if status in ("working", "waiting"):
+        if status in BUSY_STATUSES:
             status_cn = STATUS_TEXT.get(status, status)
             warning = "⚠️ 有权限弹窗，发送可能干扰确认" if status == "waiting" else ""
             msg_text = (
@@ -1157,94 +1580,125 @@ class FeishuBridgeDaemon:
             def do_send():
                 msg_id = self.feishu.send_text_message(msg_text)
                 if msg_id:
-                    self._pending_commands[msg_id] = {
-                        "terminal_id": display_id,
-                        "text": text,
-                        "timestamp": time.time(),
-                    }
+                    self._add_pending_command(msg_id, display_id, text)
                     logger.info("指令待确认: terminal=%s, status=%s", display_id, status)
                 else:
                     logger.error("发送确认消息失败: terminal=%s", display_id)
-            threading.Thread(target=do_send, daemon=True).start()
+            self._post(do_send)
             return
 
         self._send_command_to_terminal(display_id, text, info)
 
+    def _add_pending_command(self, msg_id: str, terminal_id: str, text: str):
+        """暂存待确认指令；超过上限时按时间淘汰最早的"""
+        ts = time.time()
+        with self._pending_cmd_lock:
+            self._pending_commands[msg_id] = {
+                "terminal_id": terminal_id,
+                "text": text,
+                "timestamp": ts,
+            }
+            heapq.heappush(self._pending_cmd_heap, (ts, msg_id))
+            heap = self._pending_cmd_heap
+            while len(self._pending_commands) > PENDING_COMMANDS_MAX and heap:
+                _, oldest = heapq.heappop(heap)
+                self._pending_commands.pop(oldest, None)
+
+    def _take_pending_command(self, msg_id: str) -> dict | None:
+        """取出待确认指令；已超过 TTL 但尚未被定期清理的视为过期"""
+        with self._pending_cmd_lock:
+            pending = self._pending_commands.pop(msg_id, None)
+        if pending and pending["timestamp"] < time.time() - PENDING_COMMAND_TTL:
+            return None
+        return pending
+
     def _execute_pending_command(self, answer: str, parent_id: str):
         """用户确认后执行暂存的终端指令"""
-        pending = self._pending_commands.pop(parent_id, None)
+        pending = self._take_pending_command(parent_id)
         if not pending:
             logger.warning("待确认指令已过期: msg_id=%s", parent_id)
             return
 
-        is_confirm = answer in ("y", "yes", "是")
+        is_confirm = PERMISSION_REPLIES[answer][0]
         if not is_confirm:
-            self.feishu.reply_message(parent_id, "❌ 已取消发送")
+            self._post(self.feishu.reply_message, parent_id, "❌ 已取消发送")
             logger.info("用户取消指令: terminal=%s", pending["terminal_id"])
             return
 
         info = self._resolve_terminal_or_reply(pending["terminal_id"])
         if not info:
-            self.feishu.reply_message(parent_id, f"❌ 终端 #{pending['terminal_id']} 已关闭")
+            self._post(self.feishu.reply_message, parent_id, f"❌ 终端 #{pending['terminal_id']} 已关闭")
             return
 
         self._send_command_to_terminal(pending["terminal_id"], pending["text"], info)
-        self.feishu.reply_message(parent_id, "✅ 已强制发送")
+        self._post(self.feishu.reply_message, parent_id, "✅ 已强制发送")
 
     def _send_command_to_terminal(self, display_id: str, text: str, info: dict):
         """实际发送指令到终端"""
-        socket = info.get("kitty_socket") or self._detect_socket()
+        socket = self._socket_or_reply(info)
         if not socket:
-            threading.Thread(
-                target=self.feishu.send_text_message,
-                args=("❌ 无法连接 kitty 终端",),
-                daemon=True,
-            ).start()
             logger.error("无可用 socket: terminal=%s", display_id)
             return
 
         target_window_id = info.get("window_id", display_id)
-        send_keystroke(target_window_id, text, socket)
-        time.sleep(0.15)
-        send_keystroke(target_window_id, "\r", socket)
+        send_text_and_enter(target_window_id, text, socket, self.submit_delay)
         logger.info("发送指令到终端: terminal=%s, text=%s", display_id, text[:50])
-        # 飞书确认异步发送，不阻塞
-        threading.Thread(
-            target=self.feishu.send_text_message,
-            args=(f"✅ 已发送到终端 #{display_id}",),
-            daemon=True,
-        ).start()
+        # 飞书确认异步合并发送，不阻塞
+        self._ack(f"✅ 已发送到终端 #{display_id}")
 
     def _write_pid(self):
         with open(PID_FILE, "w") as f:
             f.write(str(os.getpid()))
 
     def _handle_signal(self, signum, frame):
-        logger.info("收到信号 %d，正在停止...", signum)
+        """只置停止标志；set_wakeup_fd 已写入自管道唤醒主循环，清理在主循环退出后进行
+
+        不在信号上下文中做日志/文件操作，避免重入主线程正持有的锁或打断原子写。
+        """
+        self._stop_signal = signum
         self._running = False
-        self._cleanup()
-        sys.exit(0)
 
-    def _cleanup(self):
+    def _drain_wakeup(self):
         try:
-            os.remove(PID_FILE)
-        except FileNotFoundError:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
             pass
 
+    def _cleanup(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        signal.set_wakeup_fd(-1)
+        for fd in (self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        _safe_unlink(PID_FILE)
+
 
 # ── CLI 入口 ──────────────────────────────────────────
 
 def get_running_pid() -> int | None:
     """获取正在运行的守护进程 PID，不存在返回 None"""
-    if not os.path.exists(PID_FILE):
+    # 直接打开而非先 exists 再 open：少一次 stat，也不怕两步之间文件被删
+    try:
+        fd = os.open(PID_FILE, os.O_RDONLY)
+    except FileNotFoundError:
         return None
     try:
-        with open(PID_FILE) as f:
-            pid = int(f.read().strip())
-        os.kill(pid, 0)  # 检查进程是否存在
+        raw = os.read(fd, 32)
+    finally:
+        os.close(fd)
+    try:
+        pid = int(raw)  # int() 接受带首尾空白的 bytes
+        # kill(pid, 0) 只做存在/权限检查，不投递信号；PermissionError 说明 PID 已被其他用户的进程复用
+        os.kill(pid, 0)
         return pid
     except (ValueError, ProcessLookupError, PermissionError):
-        os.remove(PID_FILE)
+        _safe_unlink(PID_FILE)
         return None
 
 
@@ -1269,10 +1723,11 @@ def cmd_status():
     if registry:
         from terminal_registry import STATUS_TEXT, format_time_ago
         print(f"\n在线终端: {len(registry)} 个")
+        now = time.time()
         for wid, info in sorted(registry.items(), key=lambda x: int(x[0])):
             status = STATUS_TEXT.get(info.get("status", "idle"), "未知")
             title = info.get("tab_title") or "未知"
-            ago = format_time_ago(info.get("last_activity", 0))
+            ago = format_time_ago(info.get("last_activity", 0), now)
             agent_name = info.get("agent_name") or "Claude"
             agent_prefix = "" if agent_name == "Claude" else f"[{agent_name}] "
             print(f"  #{wid}  {agent_prefix}{title}  [{status}]  {ago}")
@@ -1280,15 +1735,17 @@ def cmd_status():
         print("\n无在线终端")
 
     # 显示 pending 文件
-    skip = {"daemon.pid", "registry.json"}
-    pattern = os.path.join(STATE_DIR, "*.json")
-    files = [f for f in glob.glob(pattern) if os.path.basename(f) not in skip]
+    try:
+        with os.scandir(STATE_DIR) as it:
+            files = [e.path for e in it if _is_pending_name(e.name)]
+    except FileNotFoundError:
+        files = []
     if files:
         print(f"\npending 请求: {len(files)} 个")
         for fp in files:
             try:
-                with open(fp) as f:
-                    p = json.load(f)
+                with open(fp, "rb") as f:
+                    p = _json_loads(f.read())
                 age = time.time() - p.get("timestamp", 0)
                 notified = "已通知" if p.get("notified") else "等待中"
                 print(f"  - terminal={p.get('terminal_id') or p.get('window_id')} age={int(age)}s {notified}")
@@ -9,8 +9,10 @@
 
 from __future__ import annotations
 
+import heapq
 import json
 import logging
+import time
 
 import lark_oapi as lark
 from lark_oapi.api.im.v1 import (
@@ -21,8 +23,111 @@ from lark_oapi.api.im.v1 import (
     ReplyMessageRequestBody,
 )
 
+from terminal_registry import STATUS_ICON, STATUS_TEXT, format_time_ago
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    from lark_oapi.core.http import transport as _lark_transport
+except ImportError:  # SDK 内部结构变化时不做替换，保持原行为
+    _lark_transport = None
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson：使用标准库 json
+    orjson = None
+
 logger = logging.getLogger("feishu-bridge")
 
+if orjson is not None:
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+
+_TEXT_PREFIX = '{"text":"'
+_TEXT_SUFFIX = '"}'
+
+
+def extract_text(content: str) -> str:
+    """从文本消息 content 中取出 text 字段
+
+    飞书文本消息绝大多数形如 {"text":"..."}，且不含转义字符，直接切片即可；
+    其余情况（含转义、多字段、格式不同）回退到完整 JSON 解析。
+    """
+    if not content:
+        return ""
+    if content.startswith(_TEXT_PREFIX) and content.endswith(_TEXT_SUFFIX):
+        inner = content[len(_TEXT_PREFIX):-len(_TEXT_SUFFIX)]
+        if "\\" not in inner and '"' not in inner:
+            return inner
+    try:
+        data = _json_loads(content)
+    except ValueError:
+        return ""
+    text = data.get("text", "") if isinstance(data, dict) else ""
+    return text if isinstance(text, str) else ""
+
+
+# 卡片 JSON 骨架：固定部分预先写好，发送时只序列化标题/正文/提示三个字符串字段
+_CARD_TEMPLATE = (
+    '{{"config": {{"wide_screen_mode": true}}, '
+    '"header": {{"template": "{template}", "title": {{"tag": "plain_text", "content": {header}}}}}, '
+    '"elements": [{{"tag": "markdown", "content": {content}}}, {{"tag": "hr"}}, '
+    '{{"tag": "markdown", "content": {hint}}}]}}'
+)
+
+# 无底部提示的卡片骨架（屏幕内容）
+_CARD_TEMPLATE_NO_HINT = (
+    '{{"config": {{"wide_screen_mode": true}}, '
+    '"header": {{"template": "{template}", "title": {{"tag": "plain_text", "content": {header}}}}}, '
+    '"elements": [{{"tag": "markdown", "content": {content}}}]}}'
+)
+
+_TERMINAL_LIST_HINT = _json_dumps(
+    "**#terminal_id** 详情　|　**#terminal_id 进度** 屏幕　|　**#terminal_id y/n** 权限　|　**ls -l** 预览"
+)
+
+
+class _SessionRequests:
+    """替换 lark SDK transport 模块里的 requests：request() 走共享 Session，其余属性照旧"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def request(self, method, url, **kwargs):
+        return self._session.request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def _install_keepalive_session():
+    """让 lark SDK 的同步请求复用 HTTP keep-alive 连接
+
+    SDK 每次调用 requests.request()，即每条消息新建 Session、重新 TCP/TLS 握手。
+    换成共享 Session 后同一 host 的连接进入连接池复用。只重试建连失败，不重放已发出的 POST。
+    """
+    if _lark_transport is None or isinstance(getattr(_lark_transport, "requests", None), _SessionRequests):
+        return
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1),
+    ))
+    _lark_transport.requests = _SessionRequests(session)
+
+
+TERMINAL_LIST_MAX = 30  # 终端列表卡片最多列出的终端数
+
 
 class FeishuClient:
     def __init__(self, app_id: str, app_secret: str, user_id: str):
@@ -35,6 +140,7 @@ class FeishuClient:
         self.app_id = app_id
         self.app_secret = app_secret
         self.user_id = user_id
+        _install_keepalive_session()
         self.client = (
             lark.Client.builder()
             .app_id(app_id)
@@ -42,12 +148,13 @@ class FeishuClient:
             .log_level(lark.LogLevel.INFO)
             .build()
         )
+        # WebSocket 客户端与回调绑定后复用，重连时不重复构建
+        self._ws_client = None
+        self._ws_callback = None
 
     def send_permission_message(self, pending: dict) -> str:
         """发送待确认卡片消息（权限/文本输入/选择），返回 message_id"""
         # 计算等待时长
-        import time
-
         age = time.time() - pending.get("timestamp", time.time())
         minutes = int(age // 60)
         seconds = int(age % 60)
@@ -58,6 +165,8 @@ class FeishuClient:
         screen_tail = pending.get("screen_tail", "")
         message = pending.get("message", "")
         reply_mode = pending.get("reply_mode", "permission")
+        # 切片越界时直接返回原字符串，不必先判断长度
+        screen_preview = screen_tail[-500:]
 
         # 构造详情内容
         detail_lines = []
@@ -72,16 +181,21 @@ class FeishuClient:
         if reply_mode == "selection":
             header_text = f"🔵 Claude Code 等待选择 [窗口 {wid}]"
             options = pending.get("options", [])
-            text_input_options = set(pending.get("text_input_options", []))
+            text_input_mask = pending.get("text_input_mask")
+            if text_input_mask is None:
+                # 旧版本写入的序号列表
+                text_input_options = set(pending.get("text_input_options", []))
+            else:
+                text_input_options = {
+                    i for i in range(1, len(options) + 1) if text_input_mask >> i & 1
+                }
             descriptions = pending.get("descriptions", {})
             question = pending.get("question", "")
 
             # 问题上下文 + 选项列表合并到一个代码块
             block_lines = []
             if question:
-                if len(question) > 800:
-                    question = question[-800:]
-                block_lines.append(question)
+                block_lines.append(question[-800:])
 
             if options:
                 if block_lines:
@@ -96,7 +210,6 @@ class FeishuClient:
             if block_lines:
                 detail_lines.append(f"\n```\n{chr(10).join(block_lines)}\n```")
             elif screen_tail:
-                screen_preview = screen_tail[-500:] if len(screen_tail) > 500 else screen_tail
                 detail_lines.append(f"\n```\n{screen_preview}\n```")
 
             # 构造回复提示
@@ -116,7 +229,6 @@ class FeishuClient:
             )
             card_template = "yellow"
             if screen_tail:
-                screen_preview = screen_tail[-500:] if len(screen_tail) > 500 else screen_tail
                 detail_lines.append(f"\n**终端内容**:\n```\n{screen_preview}\n```")
 
         else:
@@ -127,35 +239,15 @@ class FeishuClient:
             )
             card_template = "yellow"
             if screen_tail:
-                screen_preview = screen_tail[-500:] if len(screen_tail) > 500 else screen_tail
                 detail_lines.append(f"\n**终端内容**:\n```\n{screen_preview}\n```")
 
         detail_content = "\n".join(detail_lines)
 
-        # 构造卡片
-        card = json.dumps(
-            {
-                "config": {"wide_screen_mode": True},
-                "header": {
-                    "template": card_template,
-                    "title": {
-                        "tag": "plain_text",
-                        "content": header_text,
-                    },
-                },
-                "elements": [
-                    {
-                        "tag": "markdown",
-                        "content": detail_content,
-                    },
-                    {"tag": "hr"},
-                    {
-                        "tag": "markdown",
-                        "content": reply_hint,
-                    },
-                ],
-            },
-            ensure_ascii=False,
+        card = _CARD_TEMPLATE.format(
+            template=card_template,
+            header=_json_dumps(header_text),
+            content=_json_dumps(detail_content),
+            hint=_json_dumps(reply_hint),
         )
 
         msg_id = self._send_card(card)
@@ -165,29 +257,10 @@ class FeishuClient:
 
     def send_text_message(self, text: str) -> str:
         """发送纯文本消息，返回 message_id"""
-        content = json.dumps({"text": text}, ensure_ascii=False)
-        request = (
-            CreateMessageRequest.builder()
-            .receive_id_type("open_id")
-            .request_body(
-                CreateMessageRequestBody.builder()
-                .receive_id(self.user_id)
-                .msg_type("text")
-                .content(content)
-                .build()
-            )
-            .build()
-        )
-        resp = self.client.im.v1.message.create(request)
-        if not resp.success():
-            logger.error("飞书文本发送失败: code=%s, msg=%s", resp.code, resp.msg)
-            return ""
-        return resp.data.message_id
+        return self._create_message("text", _json_dumps({"text": text}), "文本")
 
     def send_terminal_list(self, terminals: list[dict]) -> str:
         """发送终端列表卡片"""
-        from terminal_registry import STATUS_ICON, STATUS_TEXT, format_time_ago
-
         def is_claude_only(items: list[dict]) -> bool:
             return all((item.get("agent_kind") or "claude") == "claude" for item in items)
 
@@ -196,47 +269,46 @@ class FeishuClient:
 
         claude_only = is_claude_only(terminals)
         title_text = f"📋 {'Claude' if claude_only else 'AI'} 终端列表（共 {len(terminals)} 个）"
+        # 终端过多时只列最近活跃的 TERMINAL_LIST_MAX 个（保持原有顺序），避免卡片超出飞书大小限制
+        shown = terminals
+        if len(terminals) > TERMINAL_LIST_MAX:
+            recent = {id(t) for t in heapq.nlargest(
+                TERMINAL_LIST_MAX, terminals, key=lambda t: t.get("last_activity", 0)
+            )}
+            shown = [t for t in terminals if id(t) in recent]
         lines = []
-        for t in terminals:
+        now = time.time()
+        for t in shown:
             icon = STATUS_ICON.get(t.get("status", "idle"), "⚪")
             status = STATUS_TEXT.get(t.get("status", "idle"), "未知")
             title = t.get("tab_title") or t.get("cwd", "").split("/")[-1] or "未知"
-            ago = format_time_ago(t.get("last_activity", 0))
+            ago = format_time_ago(t.get("last_activity", 0), now)
             agent_name = t.get("agent_name") or "Claude"
             agent_prefix = "" if agent_name == "Claude" else f"[{agent_name}] "
             terminal_id = t.get("terminal_id") or t.get("window_id", "?")
             lines.append(f"{icon} **#{terminal_id}**  {agent_prefix}{title}　　{status}　{ago}")
-
-        body = "\n".join(lines)
-        card = json.dumps({
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "template": "blue",
-                "title": {
-                    "tag": "plain_text",
-                    "content": title_text,
-                },
-            },
-            "elements": [
-                {"tag": "markdown", "content": body},
-                {"tag": "hr"},
-                {"tag": "markdown", "content": "**#terminal_id** 详情　|　**#terminal_id 进度** 屏幕　|　**#terminal_id y/n** 权限　|　**ls -l** 预览"},
-            ],
-        }, ensure_ascii=False)
+        if len(shown) < len(terminals):
+            lines.append(f"…另有 {len(terminals) - len(shown)} 个较久未活跃的终端未列出")
+
+        card = _CARD_TEMPLATE.format(
+            template="blue",
+            header=_json_dumps(title_text),
+            content=_json_dumps("\n".join(lines)),
+            hint=_TERMINAL_LIST_HINT,
+        )
 
         return self._send_card(card)
 
     def send_terminal_detail(self, terminal: dict) -> str:
         """发送终端详情卡片"""
-        from terminal_registry import STATUS_ICON, STATUS_TEXT, format_time_ago
-
         wid = terminal.get("terminal_id") or terminal.get("window_id", "?")
         icon = STATUS_ICON.get(terminal.get("status", "idle"), "⚪")
         status = STATUS_TEXT.get(terminal.get("status", "idle"), "未知")
         title = terminal.get("tab_title") or "未知"
         cwd = terminal.get("cwd") or "未知"
-        activity_ago = format_time_ago(terminal.get("last_activity", 0))
-        reg_ago = format_time_ago(terminal.get("registered_at", 0))
+        now = time.time()
+        activity_ago = format_time_ago(terminal.get("last_activity", 0), now)
+        reg_ago = format_time_ago(terminal.get("registered_at", 0), now)
         agent_name = terminal.get("agent_name") or "Claude"
 
         body = (
@@ -249,80 +321,69 @@ class FeishuClient:
             f"📅 **注册**: {reg_ago}"
             )
         )
-        card = json.dumps({
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "template": "turquoise",
-                "title": {
-                    "tag": "plain_text",
-                    "content": f"📺 终端 #{wid} 详情",
-                },
-            },
-            "elements": [
-                {"tag": "markdown", "content": body},
-                {"tag": "hr"},
-                {"tag": "markdown", "content": f"**#{wid} 进度** 屏幕　|　**#{wid} y/n** 权限　|　**#{wid} 文本** 发指令"},
-            ],
-        }, ensure_ascii=False)
+        card = _CARD_TEMPLATE.format(
+            template="turquoise",
+            header=_json_dumps(f"📺 终端 #{wid} 详情"),
+            content=_json_dumps(body),
+            hint=_json_dumps(f"**#{wid} 进度** 屏幕　|　**#{wid} y/n** 权限　|　**#{wid} 文本** 发指令"),
+        )
 
         return self._send_card(card)
 
     def send_terminal_screen(self, window_id: str, screen_text: str) -> str:
         """发送终端屏幕内容"""
-        import time as _time
-
-        now_str = _time.strftime("%H:%M:%S")
+        now_str = time.strftime("%H:%M:%S")
         if not screen_text:
             return self.send_text_message(f"📺 终端 #{window_id} 屏幕为空或无法抓取")
 
         # 截断过长内容
-        if len(screen_text) > 1500:
-            screen_text = screen_text[-1500:]
-
-        body = f"```\n{screen_text}\n```\n\n最后 20 行 | 抓取于 {now_str}"
-        card = json.dumps({
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "template": "purple",
-                "title": {
-                    "tag": "plain_text",
-                    "content": f"📺 终端 #{window_id} 屏幕内容",
-                },
-            },
-            "elements": [
-                {"tag": "markdown", "content": body},
-            ],
-        }, ensure_ascii=False)
+        body = f"```\n{screen_text[-1500:]}\n```\n\n最后 20 行 | 抓取于 {now_str}"
+        card = _CARD_TEMPLATE_NO_HINT.format(
+            template="purple",
+            header=_json_dumps(f"📺 终端 #{window_id} 屏幕内容"),
+            content=_json_dumps(body),
+        )
 
         return self._send_card(card)
 
     def _send_card(self, card_json: str) -> str:
         """通用卡片发送"""
+        return self._create_message("interactive", card_json, "卡片")
+
+    def _create_message(self, msg_type: str, content: str, kind: str) -> str:
+        """向 user_id 发送一条消息，返回 message_id（失败返回空串）
+
+        SDK 发送时会往 request.headers 写入鉴权头，而发送分散在多个线程，
+        因此每次都新建请求对象，不缓存复用。
+        """
         request = (
             CreateMessageRequest.builder()
             .receive_id_type("open_id")
             .request_body(
                 CreateMessageRequestBody.builder()
                 .receive_id(self.user_id)
-                .msg_type("interactive")
-                .content(card_json)
+                .msg_type(msg_type)
+                .content(content)
                 .build()
             )
             .build()
         )
         resp = self.client.im.v1.message.create(request)
         if not resp.success():
-            logger.error("飞书卡片发送失败: code=%s, msg=%s", resp.code, resp.msg)
+            logger.error("飞书%s发送失败: code=%s, msg=%s", kind, resp.code, resp.msg)
             return ""
         return resp.data.message_id
 
-    def list_messages(self, chat_id: str, start_time: int, page_size: int = 5) -> list[dict]:
+    def list_messages(
+        self, chat_id: str, start_time: int, page_size: int = 5, sender_id: str = ""
+    ) -> list[dict]:
         """拉取指定聊天的最新消息（用于轮询兜底）
 
         参数:
             chat_id: 聊天 ID（P2P 或群聊）
             start_time: 起始时间戳（秒级），只返回此时间之后的消息
             page_size: 每页条数
+            sender_id: 非空时只返回该用户（open_id）发送的消息
         返回:
             [{message_id, text, parent_id, sender_id, sender_type, create_time}]
         """
@@ -345,33 +406,29 @@ class FeishuClient:
         for msg in items:
             if msg.msg_type != "text":
                 continue
-            # 解析消息内容
-            try:
-                body_content = msg.body.content if msg.body else ""
-                content = json.loads(body_content) if body_content else {}
-                text = content.get("text", "").strip()
-            except (json.JSONDecodeError, AttributeError):
+            # 先按发送者过滤，再解析消息内容
+            sender = msg.sender
+            # 跳过机器人自己发的消息
+            if not sender or sender.sender_type != "user":
                 continue
-            if not text:
+            if sender_id and sender.id != sender_id:
                 continue
-
-            sender_type = msg.sender.sender_type if msg.sender else ""
-            # 跳过机器人自己发的消息
-            if sender_type != "user":
+            text = extract_text(msg.body.content if msg.body else "").strip()
+            if not text:
                 continue
 
             results.append({
                 "message_id": msg.message_id,
                 "text": text,
                 "parent_id": getattr(msg, "parent_id", "") or "",
-                "sender_id": msg.sender.id if msg.sender else "",
+                "sender_id": sender.id,
                 "create_time": int(msg.create_time) if msg.create_time else 0,
             })
         return results
 
     def reply_message(self, msg_id: str, text: str):
         """回复一条文本消息"""
-        content = json.dumps({"text": text}, ensure_ascii=False)
+        content = _json_dumps({"text": text})
         request = (
             ReplyMessageRequest.builder()
             .message_id(msg_id)
@@ -397,18 +454,32 @@ class FeishuClient:
         参数:
             on_reply_callback: 回调函数，签名 (data: P2ImMessageReceiveV1) -> None
         """
-        event_handler = (
-            lark.EventDispatcherHandler.builder("", "")
-            .register_p2_im_message_receive_v1(on_reply_callback)
-            .build()
-        )
+        logger.info("飞书 WebSocket 监听启动...")
+        self._get_ws_client(on_reply_callback).start()  # 阻塞运行，自动重连
 
-        ws_client = lark.ws.Client(
-            self.app_id,
-            self.app_secret,
-            event_handler=event_handler,
-            log_level=lark.LogLevel.INFO,
-        )
+    def reconnect_ws(self, on_reply_callback):
+        """
+        WebSocket 监听异常退出后重新启动
 
-        logger.info("飞书 WebSocket 监听启动...")
-        ws_client.start()  # 阻塞运行，自动重连
+        复用已创建的 ws 客户端与事件分发器；REST 调用所用的
+        tenant_access_token 由 self.client 缓存并提前刷新，重连不会重新换取。
+        """
+        logger.info("飞书 WebSocket 重新连接...")
+        self._get_ws_client(on_reply_callback).start()
+
+    def _get_ws_client(self, on_reply_callback):
+        # 绑定方法每次取属性都是新对象，用 != 比较（同一实例的同一方法相等）
+        if self._ws_client is None or self._ws_callback != on_reply_callback:
+            event_handler = (
+                lark.EventDispatcherHandler.builder("", "")
+                .register_p2_im_message_receive_v1(on_reply_callback)
+                .build()
+            )
+            self._ws_client = lark.ws.Client(
+                self.app_id,
+                self.app_secret,
+                event_handler=event_handler,
+                log_level=lark.LogLevel.INFO,
+            )
+            self._ws_callback = on_reply_callback
+        return self._ws_client
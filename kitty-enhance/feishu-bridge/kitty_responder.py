@@ -2,40 +2,274 @@
 Kitty 终端交互模块
 
 - send_keystroke: 向窗口发送按键（权限回复、指令输入）
+- send_text_and_enter: 输入文本并回车提交
+- send_key / send_keys: 向窗口发送键盘事件（方向键、Enter 等）
 - get_terminal_screen: 抓取窗口屏幕内容（进度查看）
+- list_windows: 列出 kitty 实例的全部 OS 窗口/标签/窗口（注册表扫描）
+
+远程控制命令优先通过持久的 unix socket 连接直接发送（每线程一条，按 socket 地址缓存），
+省去每次启动 `kitty @` 子进程与建连的开销；socket 不可用时回退到 `kitty @` 命令行。
 """
 
+from __future__ import annotations
+
 import json
 import logging
+import select
+import socket as _socket
 import subprocess
+import threading
+import time
+import weakref
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson：使用标准库 json
+    orjson = None
 
 logger = logging.getLogger("feishu-bridge")
 
+KITTY_TIMEOUT = 5  # 单条远程控制命令超时（秒）
+
+# kitty remote control 协议：ESC P @kitty-cmd <JSON> ESC \
+_RC_PREFIX = b"\x1bP@kitty-cmd"
+_RC_SUFFIX = b"\x1b\\"
+_RC_VERSION = [0, 14, 2]
+_KITTY_AT = ("kitty", "@", "--to")
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps_bytes = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+class _ConnectFailed(Exception):
+    """连不上 kitty socket（命令尚未发出，可以安全回退到子进程）"""
+
+
+class _KittyConn:
+    """到 kitty remote control socket 的持久连接（仅供单个线程使用）"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.sock: _socket.socket | None = None
+        # 已写出但尚未被后续响应确认的 no_response 帧（如按键前的聚焦）：
+        # 对端关闭前可能来不及处理，重连后需先补发
+        self._unconfirmed: list[tuple[bytes, ...]] = []
+
+    def _connect(self):
+        sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+        sock.settimeout(KITTY_TIMEOUT)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def is_alive(self) -> bool:
+        """空闲连接上不应有可读数据：可读意味着对端已关闭（EOF）或残留了脏数据"""
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def request(self, cmd: str, payload: dict, wait: bool = True) -> dict:
+        """发送一条命令并读取响应；wait=False 时要求 kitty 不回响应，写出即返回
+
+        连接失效时重连并重试一次；命令已写出后的超时不再重试，避免按键重复发送。
+        重连后先补发旧连接上未确认的 no_response 帧，保证其仍在本命令之前执行。
+        建连失败时抛出 _ConnectFailed，由调用方回退到子进程。
+        """
+        # 前缀/JSON/后缀用 sendmsg 一次分散写出，不再拼接成新的 bytes
+        parts = (_RC_PREFIX, _json_dumps_bytes({
+            "cmd": cmd,
+            "version": _RC_VERSION,
+            "no_response": not wait,
+            "payload": payload,
+        }), _RC_SUFFIX)
+
+        unconfirmed = self._unconfirmed
+        for attempt in range(2):
+            replay = ()
+            if not self.is_alive():
+                self.close()
+                try:
+                    self._connect()
+                except OSError as exc:
+                    unconfirmed.clear()
+                    raise _ConnectFailed(str(exc)) from exc
+                replay = tuple(unconfirmed)
+            try:
+                for frame in replay:
+                    self._send_parts(frame)
+                self._send_parts(parts)
+                if not wait:
+                    unconfirmed.append(parts)
+                    return {"ok": True}
+                response = self._read_response()
+                # kitty 按序处理同一连接上的命令：收到响应即说明之前的帧都已执行
+                unconfirmed.clear()
+                return response
+            except (BrokenPipeError, ConnectionResetError, EOFError):
+                self.close()
+                if attempt:
+                    unconfirmed.clear()
+                    raise
+            except OSError:
+                self.close()
+                unconfirmed.clear()
+                raise
+        raise _ConnectFailed("kitty socket 不可用")
+
+    def _send_parts(self, parts: tuple[bytes, ...]):
+        sent = self.sock.sendmsg(parts)
+        total = sum(map(len, parts))
+        if sent < total:  # 缓冲区不足时的部分写出，剩余部分补发
+            self.sock.sendall(b"".join(parts)[sent:])
+
+    def _read_response(self) -> dict:
+        # 大段 get-text 响应会分多次到达：原地追加，只在新到的数据里找结束符
+        buf = bytearray()
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise EOFError("kitty 关闭了连接")
+            scan_from = max(len(buf) - len(_RC_SUFFIX) + 1, 0)
+            buf += chunk
+            end = buf.find(_RC_SUFFIX, scan_from)
+            if end != -1:
+                start = buf.find(_RC_PREFIX)
+                body = buf[start + len(_RC_PREFIX):end] if start != -1 else buf[:end]
+                return _json_loads(body)
+
+
+_local = threading.local()
+# 所有线程创建过的连接（弱引用），用于 kitty 实例退出后统一释放 fd
+_all_conns: weakref.WeakSet = weakref.WeakSet()
+_all_conns_lock = threading.Lock()
 
-def focus_window(window_id: str, socket: str = "unix:@mykitty"):
+
+def _socket_address(socket: str) -> str | None:
+    """kitty socket 地址 → AF_UNIX 地址（抽象命名空间以 \\0 开头），非 unix socket 返回 None"""
+    if not socket.startswith("unix:"):
+        return None
+    path = socket[5:]
+    if not path:
+        return None
+    return "\0" + path[1:] if path.startswith("@") else path
+
+
+def get_conn(socket: str) -> _KittyConn | None:
+    """取当前线程到该 socket 的持久连接，不支持直连时返回 None"""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(socket)
+    if conn is None:
+        address = _socket_address(socket)
+        if address is None:
+            return None
+        conn = conns[socket] = _KittyConn(address)
+        with _all_conns_lock:
+            _all_conns.add(conn)
+    return conn
+
+
+def close_conns(sockets) -> int:
+    """关闭各线程中到这些 socket 的持久连接（对应 kitty 已退出），返回关闭数量
+
+    连接对象保留在各线程的缓存里，下次使用时按需重连。
     """
-    聚焦指定的 kitty 窗口
+    addresses = {_socket_address(sock) for sock in sockets}
+    with _all_conns_lock:
+        stale = [conn for conn in _all_conns if conn.address in addresses]
+    for conn in stale:
+        conn.close()
+    return len(stale)
 
-    参数:
-        window_id: kitty 窗口 ID
-        socket: kitty remote control socket 地址
+
+def _kitty_call(
+    socket: str, cmd: str, payload: dict, cli_args: tuple[str, ...] = (),
+    wait: bool = True, output: bool = False,
+) -> tuple[bool, str, str]:
+    """执行一条 kitty 远程控制命令，返回 (是否成功, 输出, 错误信息)
+
+    优先走持久连接；连不上时回退到等价的
+    `kitty @ --to socket <cmd> [--match <payload["match"]>] <cli_args>` 子进程，
+    命令行只在回退时才拼出来。
+    wait=False 只对持久连接生效：不等响应，紧随其后的命令在同一连接上按序执行。
+    output=False 时子进程的 stdout 直接丢弃，stderr 只在失败时解码。
     """
-    cmd = [
-        "kitty", "@", "--to", socket,
-        "focus-window", "--match", f"id:{window_id}",
-    ]
+    conn = get_conn(socket)
+    if conn is not None:
+        try:
+            response = conn.request(cmd, payload, wait)
+        except _ConnectFailed as exc:
+            logger.debug("kitty socket 直连失败，回退到命令行: socket=%s, err=%s", socket, exc)
+        except _socket.timeout:
+            return False, "", "超时"
+        except (OSError, EOFError, ValueError) as exc:
+            return False, "", str(exc)
+        else:
+            if response.get("ok"):
+                data = response.get("data")
+                return True, data if isinstance(data, str) else "", ""
+            return False, "", str(response.get("error", "")).strip()
+
+    match = payload.get("match")
+    match_args = ("--match", match) if match else ()
+    cmd_line = (*_KITTY_AT, socket, cmd, *match_args, *cli_args)
     try:
         result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=5
+            cmd_line,
+            stdout=subprocess.PIPE if output else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=KITTY_TIMEOUT,
         )
-        if result.returncode == 0:
-            logger.debug("窗口已聚焦: window=%s", window_id)
-        else:
-            logger.warning("窗口聚焦失败: window=%s, stderr=%s", window_id, result.stderr.strip())
     except subprocess.TimeoutExpired:
-        logger.error("窗口聚焦超时: window=%s", window_id)
+        return False, "", "超时"
     except FileNotFoundError:
-        logger.error("kitty 命令未找到")
+        return False, "", "kitty 命令未找到，请确认 kitty 已安装"
+    if result.returncode != 0:
+        return False, "", result.stderr.decode("utf-8", errors="replace").strip()
+    if not output:
+        return True, "", ""
+    return True, result.stdout.decode("utf-8", errors="replace"), ""
+
+
+def focus_window(window_id: str, socket: str = "unix:@mykitty", wait: bool = True):
+    """
+    聚焦指定的 kitty 窗口
+
+    参数:
+        window_id: kitty 窗口 ID
+        socket: kitty remote control socket 地址
+        wait: 是否等待 kitty 响应；随后还要发按键时传 False，省去一次往返等待
+    """
+    match = f"id:{window_id}"
+    ok, _, err = _kitty_call(
+        socket, "focus-window", {"match": match}, wait=wait,
+    )
+    if ok:
+        logger.debug("窗口已聚焦: window=%s", window_id)
+    else:
+        logger.warning("窗口聚焦失败: window=%s, err=%s", window_id, err)
 
 
 def send_keystroke(window_id: str, text: str, socket: str = "unix:@mykitty"):
@@ -48,27 +282,38 @@ def send_keystroke(window_id: str, text: str, socket: str = "unix:@mykitty"):
         socket: kitty remote control socket 地址
     """
     # 先聚焦窗口，确保按键能发送到未选中的窗口
-    focus_window(window_id, socket)
+    focus_window(window_id, socket, wait=False)
+    _send_text(window_id, text, socket)
 
-    cmd = [
-        "kitty", "@", "--to", socket,
-        "send-text", "--match", f"id:{window_id}", text,
-    ]
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=5
-        )
-        if result.returncode == 0:
-            logger.info("按键已发送: window=%s, text=%r", window_id, text)
-        else:
-            logger.error(
-                "按键发送失败: window=%s, stderr=%s",
-                window_id, result.stderr.strip(),
-            )
-    except subprocess.TimeoutExpired:
-        logger.error("按键发送超时: window=%s", window_id)
-    except FileNotFoundError:
-        logger.error("kitty 命令未找到，请确认 kitty 已安装")
+
+def send_text_and_enter(
+    window_id: str, text: str, socket: str = "unix:@mykitty", submit_delay: float = 0.15
+):
+    """
+    输入文本后回车提交（只聚焦一次）
+
+    文本与回车分两次发送并间隔 submit_delay：同一批到达的 "文本\\r"
+    会被 TUI 当作粘贴内容，回车变成换行而不是提交。
+    submit_delay <= 0 时合并为一次 send-text，适用于不区分粘贴的程序。
+    """
+    focus_window(window_id, socket, wait=False)
+    if submit_delay <= 0:
+        _send_text(window_id, text + "\r", socket)
+        return
+    _send_text(window_id, text, socket)
+    time.sleep(submit_delay)
+    _send_text(window_id, "\r", socket)
+
+
+def _send_text(window_id: str, text: str, socket: str):
+    match = f"id:{window_id}"
+    ok, _, err = _kitty_call(
+        socket, "send-text", {"match": match, "data": "text:" + text}, (text,),
+    )
+    if ok:
+        logger.info("按键已发送: window=%s, text=%r", window_id, text)
+    else:
+        logger.error("按键发送失败: window=%s, err=%s", window_id, err)
 
 
 def send_key(window_id: str, key_name: str, socket: str = "unix:@mykitty"):
@@ -80,63 +325,85 @@ def send_key(window_id: str, key_name: str, socket: str = "unix:@mykitty"):
         key_name: 键名，如 "enter", "escape", "tab"
         socket: kitty remote control socket 地址
     """
+    send_keys(window_id, [key_name], socket)
+
+
+def send_keys(window_id: str, key_names: list[str], socket: str = "unix:@mykitty"):
+    """
+    一次 send-key 调用按顺序发送多个键盘事件（如连续 N 个 "down"）
+
+    参数:
+        window_id: kitty 窗口 ID
+        key_names: 键名列表
+        socket: kitty remote control socket 地址
+    """
+    if not key_names:
+        return
+
     # 先聚焦窗口，确保按键能发送到未选中的窗口
-    focus_window(window_id, socket)
+    focus_window(window_id, socket, wait=False)
 
-    cmd = [
-        "kitty", "@", "--to", socket,
-        "send-key", "--match", f"id:{window_id}", key_name,
-    ]
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=5
-        )
-        if result.returncode == 0:
-            logger.info("键盘事件已发送: window=%s, key=%s", window_id, key_name)
-        else:
-            logger.error(
-                "键盘事件发送失败: window=%s, stderr=%s",
-                window_id, result.stderr.strip(),
-            )
-    except subprocess.TimeoutExpired:
-        logger.error("键盘事件发送超时: window=%s", window_id)
-    except FileNotFoundError:
-        logger.error("kitty 命令未找到，请确认 kitty 已安装")
+    match = f"id:{window_id}"
+    ok, _, err = _kitty_call(
+        socket, "send-key", {"match": match, "keys": list(key_names)}, tuple(key_names),
+    )
+    if ok:
+        logger.info("键盘事件已发送: window=%s, keys=%s", window_id, " ".join(key_names))
+    else:
+        logger.error("键盘事件发送失败: window=%s, err=%s", window_id, err)
 
 
 def clear_screen(window_id: str, socket: str = "unix:@mykitty"):
     """清空指定窗口的屏幕"""
-    cmd = [
-        "kitty", "@", "--to", socket,
-        "clear-screen", "--match", f"id:{window_id}",
-    ]
+    match = f"id:{window_id}"
+    ok, _, err = _kitty_call(
+        socket, "clear-screen", {"match": match},
+    )
+    if ok:
+        logger.info("屏幕已清空: window=%s", window_id)
+    else:
+        logger.error("清屏失败: window=%s, err=%s", window_id, err)
+
+
+def list_windows(socket: str) -> list | None:
+    """kitty @ ls：返回解析后的窗口树，失败返回 None"""
+    ok, text, err = _kitty_call(socket, "ls", {}, output=True)
+    if not ok:
+        logger.warning("kitty ls 失败: socket=%s, err=%s", socket, err)
+        return None
     try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=5
-        )
-        if result.returncode == 0:
-            logger.info("屏幕已清空: window=%s", window_id)
-        else:
-            logger.error("清屏失败: window=%s, stderr=%s", window_id, result.stderr.strip())
-    except subprocess.TimeoutExpired:
-        logger.error("清屏超时: window=%s", window_id)
-    except FileNotFoundError:
-        logger.error("kitty 命令未找到")
+        return _json_loads(text)
+    except ValueError:
+        logger.debug("kitty ls 输出无法解析: socket=%s", socket)
+        return None
 
 
 def get_terminal_screen(
     window_id: str, socket: str = "unix:@mykitty", lines: int = 20
 ) -> str:
     """抓取终端屏幕内容，返回最后 N 行非空行"""
-    cmd = [
-        "kitty", "@", "--to", socket,
-        "get-text", "--match", f"id:{window_id}", "--extent=screen",
-    ]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            return ""
-        all_lines = [l for l in result.stdout.strip().split("\n") if l.strip()]
-        return "\n".join(all_lines[-lines:])
-    except (subprocess.TimeoutExpired, FileNotFoundError):
+    match = f"id:{window_id}"
+    ok, text, _ = _kitty_call(
+        socket, "get-text", {"match": match, "extent": "screen"}, ("--extent=screen",),
+        output=True,
+    )
+    if not ok:
         return ""
+    return "\n".join(_tail_lines(text, lines))
+
+
+def _tail_lines(text: str, n: int) -> list[str]:
+    """从末尾向前取最后 n 个非空行（保持原顺序）
+
+    用 rfind 逐行回退，只处理需要的后缀，不为整屏 / 整段回滚内容创建行列表。
+    """
+    tail: list[str] = []
+    end = len(text)
+    while end >= 0 and len(tail) < n:
+        start = text.rfind("\n", 0, end)
+        line = text[start + 1:end]
+        if line.strip():
+            tail.append(line)
+        end = start
+    tail.reverse()
+    return tail
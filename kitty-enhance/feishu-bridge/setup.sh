@@ -148,7 +148,7 @@ feishu:
 
 bridge:
   wait_minutes: 5      # 等待多久后发飞书通知
-  poll_interval: 2     # 扫描 pending 文件间隔（秒）
+  poll_interval: 2     # 轮询 pending 文件间隔（秒，无 inotify 时使用）
   expire_minutes: 30   # pending 文件过期清理时间
 EOF
 
@@ -12,12 +12,31 @@ import logging
 import os
 import re
 import subprocess
+import tempfile
+import threading
 import time
 
+try:
+    import orjson
+except ImportError:  # 可选依赖：未安装时使用标准库 json
+    orjson = None
+
 logger = logging.getLogger("feishu-bridge")
 
+if orjson is not None:
+    _json_loads = orjson.loads
+
+    def _dump_registry_bytes(registry: dict) -> bytes:
+        return orjson.dumps(registry, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _json_loads = json.loads
+
+    def _dump_registry_bytes(registry: dict) -> bytes:
+        return json.dumps(registry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 REGISTRY_FILE = "/tmp/feishu-bridge/registry.json"
 _SOCKET_LABEL_RE = re.compile(r"[^A-Za-z0-9._-]+")
+_basename = os.path.basename
 
 
 def socket_to_label(socket: str) -> str:
@@ -71,39 +90,72 @@ def _pick_newer_entry(existing: dict, candidate: dict) -> dict:
     return candidate if candidate_score >= existing_score else existing
 
 
+# /proc/net/unix 中处于监听状态（Flags=__SO_ACCEPTCON）的 @mykitty-* 抽象 socket；
+# 已 accept 的连接也带同名路径，但 Flags 不同，不会被匹配
+_PROC_KITTY_RE = re.compile(
+    rb"^[0-9a-f]+: [0-9A-F]+ [0-9A-F]+ 00010000 [0-9A-F]+ [0-9A-F]+ +\d+ (@mykitty-\S+)$", re.M
+)
+_SS_KITTY_RE = re.compile(rb"@mykitty-\S+")
+
+
 def discover_kitty_sockets() -> list[str]:
-    """发现所有运行中的 kitty socket"""
+    """发现所有运行中的 kitty socket
+
+    优先直接读 /proc/net/unix（免去 fork ss），不可用时回退到 `ss -lx`；
+    两者都按字节一次正则扫描，不逐行解码。
+    """
     try:
-        result = subprocess.run(
-            ["ss", "-lx"], capture_output=True, text=True, timeout=5
-        )
+        with open("/proc/net/unix", "rb") as f:
+            names = _PROC_KITTY_RE.findall(f.read())
+    except OSError:
+        try:
+            result = subprocess.run(["ss", "-lx"], capture_output=True, timeout=5)
+        except Exception:
+            return []
         if result.returncode != 0:
             return []
-        sockets = []
-        for line in result.stdout.splitlines():
-            # 匹配 @mykitty-PID 格式
-            idx = line.find("@mykitty-")
-            if idx == -1:
-                continue
-            # 提取 socket 名（到空格为止）
-            rest = line[idx:]
-            name = rest.split()[0]
-            sockets.append(f"unix:{name}")
-        return sockets
-    except Exception:
-        return []
+        names = _SS_KITTY_RE.findall(result.stdout)
+    return [f"unix:{name.decode()}" for name in dict.fromkeys(names)]
+
+
+# 上次解析结果：((st_mtime_ns, st_size, st_ino), {terminal_id: info_dict})，文件未变时免去重新解析
+_registry_cache: tuple[tuple[int, int, int], dict] | None = None
+
+
+def _stat_key(st: os.stat_result) -> tuple[int, int, int]:
+    return st.st_mtime_ns, st.st_size, st.st_ino
 
 
 def load_registry() -> dict:
-    """读取注册表，返回 {terminal_id: info_dict}"""
+    """读取注册表，返回 {terminal_id: info_dict}
+
+    文件 mtime/大小/inode 未变时直接复制上次的解析结果。调用方会就地修改返回值，
+    因此每次返回各条目的浅拷贝，缓存本身不被改动。
+    """
+    global _registry_cache
+    try:
+        key = _stat_key(os.stat(REGISTRY_FILE))
+    except FileNotFoundError:
+        return {}
+    cached = _registry_cache
+    if cached is not None and cached[0] == key:
+        return {terminal_id: dict(entry) for terminal_id, entry in cached[1].items()}
+
     try:
-        with open(REGISTRY_FILE, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+        with open(REGISTRY_FILE, "rb") as f:
+            key = _stat_key(os.fstat(f.fileno()))
+            raw = _json_loads(f.read())
+    except (FileNotFoundError, ValueError):  # 含 JSONDecodeError
         return {}
     if not isinstance(raw, dict):
         return {}
 
+    normalized = _normalize_registry(raw)
+    _registry_cache = (key, {terminal_id: dict(entry) for terminal_id, entry in normalized.items()})
+    return normalized
+
+
+def _normalize_registry(raw: dict) -> dict:
     normalized: dict[str, dict] = {}
     for entry_key, entry in raw.items():
         converted = _normalize_terminal_entry(str(entry_key), entry)
@@ -118,26 +170,40 @@ def load_registry() -> dict:
 
 
 def save_registry(registry: dict):
-    """写入注册表"""
-    os.makedirs(os.path.dirname(REGISTRY_FILE), exist_ok=True)
-    with open(REGISTRY_FILE, "w", encoding="utf-8") as f:
-        json.dump(registry, f, ensure_ascii=False, indent=2)
+    """原子写入注册表：写临时文件后 rename，hook 与 daemon 并发读时不会读到半截 JSON
+
+    写完后用文件的新 stat 更新解析缓存，本进程随后的 load_registry 不必再解析刚写出的内容。
+    """
+    global _registry_cache
+    registry_dir = os.path.dirname(REGISTRY_FILE)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=registry_dir, prefix=".registry-", suffix=".tmp")
+    except FileNotFoundError:
+        # 目录通常已存在，只在首次（或 /tmp 被清理后）创建，省去每次保存的 makedirs
+        os.makedirs(registry_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=registry_dir, prefix=".registry-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_dump_registry_bytes(registry))
+            f.flush()
+            key = _stat_key(os.fstat(f.fileno()))
+        os.replace(tmp_path, REGISTRY_FILE)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _registry_cache = (key, _normalize_registry(registry))
 
 
 def get_active_window_ids(socket: str) -> set[str]:
     """通过 kitty @ ls 获取当前所有窗口 ID"""
-    cmd = ["kitty", "@", "--to", socket, "ls"]
+    data = _kitty_ls(socket)
+    if data is None:
+        return set()
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            return set()
-        data = json.loads(result.stdout)
-        ids = set()
-        for os_win in data:
-            for tab in os_win.get("tabs", []):
-                for win in tab.get("windows", []):
-                    ids.add(str(win.get("id", "")))
-        return ids
+        return {str(win.get("id", "")) for _, win in _iter_windows(data)}
     except Exception:
         logger.debug("获取窗口列表失败")
         return set()
@@ -150,13 +216,22 @@ def _agent_name(kind: str) -> str:
 
 
 def _detect_agent_kind(win: dict) -> str | None:
-    """判断窗口是否运行受支持的 AI 终端"""
-    for proc in win.get("foreground_processes", []):
-        cmdline = proc.get("cmdline", [])
-        tokens = [os.path.basename(str(token)).lower() for token in cmdline if token]
-        if any("claude" in token for token in tokens):
-            return "claude"
-        if any(token == "codex" or token.startswith("codex-") for token in tokens):
+    """判断窗口是否运行受支持的 AI 终端
+
+    检查 cmdline 的每个参数而不只是 argv[0]：claude 常以 `node .../claude` 形式运行。
+    同一进程中 claude 优先于 codex；单趟遍历，命中 claude 立即返回。
+    """
+    for proc in win.get("foreground_processes", ()):
+        is_codex = False
+        for token in proc.get("cmdline") or ():
+            if not token:
+                continue
+            name = _basename(str(token)).lower()
+            if "claude" in name:
+                return "claude"
+            if not is_codex and (name == "codex" or name.startswith("codex-")):
+                is_codex = True
+        if is_codex:
             return "codex"
     return None
 
@@ -172,7 +247,7 @@ def cleanup_registry(socket: str) -> int:
         # kitty 命令失败时不清理，避免误删
         return 0
 
-    to_remove = [terminal_id for terminal_id in registry if terminal_id not in active_terminals]
+    to_remove = registry.keys() - active_terminals
     for terminal_id in to_remove:
         del registry[terminal_id]
         logger.info("清理终端: terminal=%s", terminal_id)
@@ -182,95 +257,129 @@ def cleanup_registry(socket: str) -> int:
     return len(to_remove)
 
 
+def _kitty_ls(socket: str) -> list | None:
+    """执行一次 kitty @ ls 并解析，失败返回 None
+
+    直接走 kitty remote control socket（不可用时 kitty_responder 自动回退到子进程）。
+    hook 脚本也会 import 本模块但从不扫描，因此 kitty_responder 在这里按需导入。
+    """
+    from kitty_responder import list_windows
+
+    return list_windows(socket)
+
+
+def _iter_windows(data: list):
+    """遍历 ls 结果中的全部窗口，产出 (tab_title, win)"""
+    for os_win in data:
+        for tab in os_win.get("tabs", ()):
+            tab_title = tab.get("title", "")
+            for win in tab.get("windows", ()):
+                yield tab_title, win
+
+
+def _supported_ids_from_ls(socket: str, data: list) -> set[str]:
+    """从 ls 结果中取出运行受支持 AI 终端的 terminal_id"""
+    ids = set()
+    for _, win in _iter_windows(data):
+        if not _detect_agent_kind(win):
+            continue
+        wid = str(win.get("id", ""))
+        if wid:
+            ids.add(build_terminal_id(wid, socket))
+    return ids
+
+
 def _get_supported_terminal_ids(socket: str) -> set[str] | None:
     """获取所有运行受支持 AI 终端的 terminal_id，失败返回 None"""
-    cmd = ["kitty", "@", "--to", socket, "ls"]
+    data = _kitty_ls(socket)
+    if data is None:
+        return None
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            return None
-        data = json.loads(result.stdout)
-        ids = set()
-        for os_win in data:
-            for tab in os_win.get("tabs", []):
-                for win in tab.get("windows", []):
-                    agent_kind = _detect_agent_kind(win)
-                    if not agent_kind:
-                        continue
-                    wid = str(win.get("id", ""))
-                    if wid:
-                        ids.add(build_terminal_id(wid, socket))
-        return ids
+        return _supported_ids_from_ls(socket, data)
     except Exception:
         return None
 
 
-def scan_and_register(socket: str) -> int:
-    """扫描单个 kitty socket，将运行受支持 AI 终端的窗口自动注册，返回新注册数量"""
-    cmd = ["kitty", "@", "--to", socket, "ls"]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            logger.warning("kitty ls 失败: socket=%s, rc=%d", socket, result.returncode)
-            return 0
-        data = json.loads(result.stdout)
-    except Exception:
-        logger.debug("扫描窗口失败: socket=%s", socket)
-        return 0
+def _register_from_ls(
+    registry: dict, socket: str, data: list, now: float, supported: set[str] | None = None
+) -> tuple[int, int]:
+    """按 ls 结果就地注册/更新 registry 中的受支持终端（不写盘）
 
-    registry = load_registry()
+    返回 (新注册数量, 字段有变化的已注册数量)，任一非零时调用方需要写盘。
+    传入 supported 时顺带收集受支持终端的 terminal_id，清理时不必再遍历一遍。
+    """
     new_count = 0
-    now = time.time()
-
+    updated = 0
     supported_ids = []
     all_wids = []
-    for os_win in data:
-        for tab in os_win.get("tabs", []):
-            tab_title = tab.get("title", "")
-            for win in tab.get("windows", []):
-                wid = str(win.get("id", ""))
-                if not wid:
-                    continue
-                all_wids.append(wid)
-                agent_kind = _detect_agent_kind(win)
-                if not agent_kind:
-                    continue
-                terminal_id = build_terminal_id(wid, socket)
-                supported_ids.append(f"{terminal_id}:{agent_kind}")
-                if terminal_id in registry:
-                    # 已注册的更新 tab_title 和 socket（可能变化）
-                    if tab_title and registry[terminal_id].get("tab_title") != tab_title:
-                        registry[terminal_id]["tab_title"] = tab_title
-                    registry[terminal_id]["kitty_socket"] = socket
-                    registry[terminal_id]["socket_label"] = socket_to_label(socket)
-                    registry[terminal_id]["agent_kind"] = agent_kind
-                    registry[terminal_id]["agent_name"] = _agent_name(agent_kind)
-                    continue
-                cwd = ""
-                foreground = win.get("foreground_processes", [])
-                if foreground:
-                    cwd = foreground[0].get("cwd", "")
-                registry[terminal_id] = {
-                    "terminal_id": terminal_id,
-                    "window_id": wid,
-                    "kitty_socket": socket,
-                    "socket_label": socket_to_label(socket),
-                    "tab_title": tab_title,
-                    "cwd": cwd,
-                    "registered_at": now,
-                    "last_activity": now,
-                    "status": "idle",
-                    "agent_kind": agent_kind,
-                    "agent_name": _agent_name(agent_kind),
-                }
-                new_count += 1
+    label = socket_to_label(socket)
+    for tab_title, win in _iter_windows(data):
+        wid = str(win.get("id", ""))
+        if not wid:
+            continue
+        all_wids.append(wid)
+        agent_kind = _detect_agent_kind(win)
+        if not agent_kind:
+            continue
+        terminal_id = build_terminal_id(wid, socket)
+        supported_ids.append(f"{terminal_id}:{agent_kind}")
+        if supported is not None:
+            supported.add(terminal_id)
+        entry = registry.get(terminal_id)
+        if entry is not None:
+            # 已注册的更新 tab_title 和 socket（可能变化），只在确有变化时计入
+            changes = {
+                "kitty_socket": socket,
+                "socket_label": label,
+                "agent_kind": agent_kind,
+                "agent_name": _agent_name(agent_kind),
+            }
+            if tab_title:
+                changes["tab_title"] = tab_title
+            if any(entry.get(key) != value for key, value in changes.items()):
+                entry.update(changes)
+                updated += 1
+            continue
+        cwd = ""
+        foreground = win.get("foreground_processes")
+        if foreground:
+            cwd = foreground[0].get("cwd", "")
+        registry[terminal_id] = {
+            "terminal_id": terminal_id,
+            "window_id": wid,
+            "kitty_socket": socket,
+            "socket_label": label,
+            "tab_title": tab_title,
+            "cwd": cwd,
+            "registered_at": now,
+            "last_activity": now,
+            "status": "idle",
+            "agent_kind": agent_kind,
+            "agent_name": _agent_name(agent_kind),
+        }
+        new_count += 1
 
-    if new_count:
-        save_registry(registry)
     if new_count:
         logger.info("扫描注册: socket=%s, 新增 %d 个终端", socket, new_count)
     logger.debug("扫描结果: socket=%s, 总窗口=%d, 受支持终端=%s",
                  socket, len(all_wids), supported_ids)
+    return new_count, updated
+
+
+def scan_and_register(socket: str) -> int:
+    """扫描单个 kitty socket，将运行受支持 AI 终端的窗口自动注册，返回新注册数量"""
+    data = _kitty_ls(socket)
+    if data is None:
+        return 0
+
+    registry = load_registry()
+    try:
+        new_count, updated = _register_from_ls(registry, socket, data, time.time())
+    except Exception:
+        logger.debug("扫描窗口失败: socket=%s", socket)
+        return 0
+    if new_count or updated:
+        save_registry(registry)
     return new_count
 
 
@@ -281,58 +390,115 @@ _SOCKET_CACHE_TTL = 60  # 60 秒刷新一次 socket 发现
 
 
 def _get_sockets() -> list[str]:
-    """获取 kitty socket 列表（带缓存）"""
+    """获取 kitty socket 列表（带缓存）
+
+    刷新时发现消失的 socket（kitty 已退出），顺带关闭到它们的持久连接。
+    """
     global _cached_sockets, _cached_sockets_time
     now = time.time()
     if now - _cached_sockets_time < _SOCKET_CACHE_TTL and _cached_sockets:
         return _cached_sockets
+    previous = _cached_sockets
     _cached_sockets = discover_kitty_sockets()
     _cached_sockets_time = now
+    gone = set(previous).difference(_cached_sockets)
+    if gone:
+        from kitty_responder import close_conns
+
+        close_conns(gone)
     return _cached_sockets
 
 
+# 多 socket 并发 ls 的常驻线程池：工作线程各自保持到 kitty 的持久连接，跨轮次复用
+_ls_pool = None
+_ls_pool_lock = threading.Lock()  # daemon 可能在多个工作线程上同时刷新注册表
+
+
+def _ls_all(sockets: list[str]) -> list[tuple[str, list]]:
+    """并发对每个 socket 执行 ls，返回成功的 [(socket, 窗口树)]（保持 socket 顺序）
+
+    单个 socket 时直接在当前线程调用，复用该线程到 kitty 的持久连接。
+    """
+    global _ls_pool
+    if len(sockets) == 1:
+        results = [(sockets[0], _kitty_ls(sockets[0]))]
+    else:
+        if _ls_pool is None:
+            with _ls_pool_lock:
+                if _ls_pool is None:
+                    from concurrent.futures import ThreadPoolExecutor  # 仅 daemon 扫描时需要，hook 不加载
+
+                    _ls_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="kitty-ls")
+        results = list(zip(sockets, _ls_pool.map(_kitty_ls, sockets)))
+    return [(sock, data) for sock, data in results if data is not None]
+
+
 def scan_all_kitty() -> int:
-    """发现所有 kitty socket，逐个扫描注册，返回总新增数量"""
+    """发现所有 kitty socket，并发 ls 后统一注册，返回总新增数量"""
     sockets = _get_sockets()
     if not sockets:
         return 0
+    listed = _ls_all(sockets)
+    if not listed:
+        return 0
+
+    registry = load_registry()
+    now = time.time()
     total = 0
-    for sock in sockets:
-        total += scan_and_register(sock)
+    dirty = False
+    for sock, data in listed:
+        try:
+            added, updated = _register_from_ls(registry, sock, data, now)
+        except Exception:
+            logger.debug("扫描窗口失败: socket=%s", sock)
+            continue
+        total += added
+        dirty = dirty or bool(added or updated)
+    if dirty:
+        save_registry(registry)
     if total:
         logger.info("多实例扫描: %d 个 kitty, 新增 %d 个终端", len(sockets), total)
     return total
 
 
-def cleanup_all_kitty() -> int:
-    """跨所有 kitty socket 清理注册表，返回移除数量"""
-    registry = load_registry()
-    if not registry:
-        return 0
+def scan_and_cleanup_all_kitty() -> tuple[int, int]:
+    """扫描注册 + 清理合并为一轮：每个 socket 只 ls 一次（并发），注册表只读写各一次
 
+    返回 (新增数量, 移除数量)。所有 socket 的 ls 都失败时不做清理，避免误删。
+    """
     sockets = _get_sockets()
     if not sockets:
-        return 0
+        return 0, 0
 
-    all_supported_terminals: set[str] = set()
-    any_success = False
-    for sock in sockets:
-        terminal_ids = _get_supported_terminal_ids(sock)
-        if terminal_ids is not None:
-            all_supported_terminals.update(terminal_ids)
-            any_success = True
+    # 先完成较慢的 ls，再读-改-写注册表，缩短与 hook 并发写入的窗口
+    listed = _ls_all(sockets)
+    if not listed:
+        return 0, 0
 
-    if not any_success:
-        return 0
-
-    to_remove = [terminal_id for terminal_id in registry if terminal_id not in all_supported_terminals]
+    registry = load_registry()
+    now = time.time()
+    added = 0
+    updated = 0
+    supported: set[str] = set()
+    for sock, data in listed:
+        try:
+            sock_added, sock_updated = _register_from_ls(registry, sock, data, now, supported)
+        except Exception:
+            logger.debug("扫描窗口失败: socket=%s", sock)
+            return 0, 0
+        added += sock_added
+        updated += sock_updated
+
+    to_remove = registry.keys() - supported
     for terminal_id in to_remove:
         del registry[terminal_id]
         logger.info("清理终端: terminal=%s", terminal_id)
 
-    if to_remove:
+    if added or updated or to_remove:
         save_registry(registry)
-    return len(to_remove)
+    if added:
+        logger.info("多实例扫描: %d 个 kitty, 新增 %d 个终端", len(sockets), added)
+    return added, len(to_remove)
 
 
 def resolve_terminal_selector(selector: str, registry: dict | None = None) -> tuple[dict | None, list[dict]]:
@@ -363,9 +529,9 @@ def get_terminal_info(selector: str) -> dict | None:
     return terminal
 
 
-def format_time_ago(ts: float) -> str:
-    """格式化时间差为可读字符串"""
-    ago = time.time() - ts
+def format_time_ago(ts: float, now: float | None = None) -> str:
+    """格式化时间差为可读字符串；批量格式化时可传入同一个 now"""
+    ago = (time.time() if now is None else now) - ts
     if ago < 60:
         return "刚刚"
     if ago < 3600:
@@ -64,7 +64,8 @@ except Exception:
     hook_data = {}
 
 screen = os.environ.get('SCREEN_TEXT', '')
-lines = [l for l in screen.strip().split('\n') if l.strip()] if screen else []
+# 去掉终端行尾填充空格
+lines = [l.rstrip() for l in screen.strip().split('\n') if l.strip()] if screen else []
 screen_tail = '\n'.join(lines[-50:]) if lines else ''
 
 pending = {
@@ -82,8 +83,11 @@ pending = {
 state_dir = '/tmp/feishu-bridge'
 path = os.path.join(state_dir, f'{terminal_id}.json')
 legacy_path = os.path.join(state_dir, f'{window_id}.json')
-with open(path, 'w', encoding='utf-8') as f:
+# 先写临时文件再 rename，守护进程不会读到半截 JSON
+tmp_path = f'{path}.{os.getpid()}.tmp'
+with open(tmp_path, 'w', encoding='utf-8') as f:
     json.dump(pending, f, ensure_ascii=False, indent=2)
+os.replace(tmp_path, path)
 if legacy_path != path:
     try:
         os.remove(legacy_path)
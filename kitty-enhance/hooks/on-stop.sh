@@ -116,8 +116,11 @@ info = {
 path = f"/tmp/feishu-bridge/{terminal_id}_completed.json"
 legacy_path = f"/tmp/feishu-bridge/{window_id}_completed.json"
 os.makedirs("/tmp/feishu-bridge", exist_ok=True)
-with open(path, "w", encoding="utf-8") as f:
+# 先写临时文件再 rename，守护进程不会读到半截 JSON
+tmp_path = f"{path}.{os.getpid()}.tmp"
+with open(tmp_path, "w", encoding="utf-8") as f:
     json.dump(info, f, ensure_ascii=False, indent=2)
+os.replace(tmp_path, path)
 if legacy_path != path:
     try:
         os.remove(legacy_path)
@@ -237,12 +237,12 @@ class CodexEventMonitor:
             return False
 
         for os_window in data:
-            for tab in os_window.get("tabs", []):
-                for window in tab.get("windows", []):
+            for tab in os_window.get("tabs", ()):
+                for window in tab.get("windows", ()):
                     if str(window.get("id", "")) != self.window_id:
                         continue
-                    for process in window.get("foreground_processes", []):
-                        cmdline = process.get("cmdline") or []
+                    for process in window.get("foreground_processes", ()):
+                        cmdline = process.get("cmdline") or ()
                         for token in cmdline:
                             basename = os.path.basename(str(token)).lower()
                             if basename == "codex" or basename.startswith("codex-"):
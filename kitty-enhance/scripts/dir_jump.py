@@ -130,9 +130,9 @@ def _list_windows(socket: str) -> list[dict]:
 
     out: list[dict] = []
     for os_win in data:
-        for tab in os_win.get("tabs", []):
+        for tab in os_win.get("tabs", ()):
             tab_title = tab.get("title", "")
-            for win in tab.get("windows", []):
+            for win in tab.get("windows", ()):
                 wid = str(win.get("id", ""))
                 cwd = win.get("cwd", "") or ""
                 if not wid or not cwd:
@@ -0,0 +1,58 @@
+"""Tests for feishu-bridge command parsing."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent / "feishu-bridge"
+sys.path.insert(0, str(ROOT))
+
+from command_handler import parse_command  # noqa: E402
+
+
+def test_keyword_commands_are_case_insensitive():
+    assert parse_command(" Y ") == {"type": "permission_reply", "answer": "y"}
+    assert parse_command("是") == {"type": "permission_reply", "answer": "是"}
+    assert parse_command("HELP") == {"type": "help"}
+    assert parse_command("LS -L") == {"type": "list_terminals", "detail": True}
+    assert parse_command("列表") == {"type": "list_terminals", "detail": False}
+    assert parse_command("hello") == {"type": "ignore"}
+    assert parse_command("   ") == {"type": "unknown"}
+
+
+def test_selector_commands_keep_terminal_id_and_text_case():
+    assert parse_command("#2@mykitty-1827907") == {
+        "type": "terminal_detail",
+        "window_id": "2@mykitty-1827907",
+    }
+    assert parse_command("＃12 进度") == {"type": "terminal_screen", "window_id": "12"}
+    assert parse_command("@3 Run Tests") == {
+        "type": "terminal_command",
+        "window_id": "3",
+        "text": "Run Tests",
+    }
+
+
+def test_selector_special_keys():
+    assert parse_command("#3 ESC") == {"type": "terminal_key", "window_id": "3", "key": "esc"}
+    assert parse_command("#3 Ctrl+C") == {"type": "terminal_key", "window_id": "3", "key": "ctrl-c"}
+    assert parse_command("#3 clear") == {"type": "terminal_clear", "window_id": "3"}
+
+
+def test_bare_selector_prefix_is_ignored():
+    assert parse_command("#") == {"type": "ignore"}
+    assert parse_command("# 3") == {"type": "ignore"}
+
+
+def test_selector_splits_on_any_whitespace_and_keeps_first_line():
+    assert parse_command("#3\tls -la") == {
+        "type": "terminal_command",
+        "window_id": "3",
+        "text": "ls -la",
+    }
+    assert parse_command("#3 git status\nignored") == {
+        "type": "terminal_command",
+        "window_id": "3",
+        "text": "git status",
+    }
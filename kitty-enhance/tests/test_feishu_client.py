@@ -0,0 +1,80 @@
+"""Tests for feishu-bridge Feishu card rendering and client helpers."""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent / "feishu-bridge"
+sys.path.insert(0, str(ROOT))
+
+pytest.importorskip("lark_oapi")
+
+import daemon  # noqa: E402
+import feishu_client  # noqa: E402
+
+
+def _client():
+    return feishu_client.FeishuClient("cli_test", "secret", "ou_test")
+
+
+def _card_text(card: str) -> str:
+    return "\n".join(
+        element["content"]
+        for element in json.loads(card)["elements"]
+        if element.get("tag") == "markdown"
+    )
+
+
+def test_selection_card_marks_text_input_options(monkeypatch):
+    cards = []
+    client = _client()
+    monkeypatch.setattr(client, "_send_card", lambda card: cards.append(card) or "om_1")
+
+    parsed = daemon.parse_selection_screen(
+        "Which approach?\n1. Yes\n2. No\n3. Type something."
+    )
+    pending = {"window_id": "7", "reply_mode": "selection", **parsed}
+    assert client.send_permission_message(pending) == "om_1"
+
+    text = _card_text(cards[0])
+    assert "1. Yes" in text
+    assert "📝 Type something." in text
+    assert "3. Type something." not in text
+    assert "📝 选项需附文字：**3 你的内容**" in text
+
+
+def test_selection_card_accepts_legacy_text_input_list(monkeypatch):
+    cards = []
+    client = _client()
+    monkeypatch.setattr(client, "_send_card", lambda card: cards.append(card) or "om_1")
+
+    client.send_permission_message({
+        "window_id": "7",
+        "reply_mode": "selection",
+        "options": ["Yes", "Other"],
+        "text_input_options": [2],
+    })
+
+    assert "📝 Other" in _card_text(cards[0])
+
+
+def test_reconnect_reuses_ws_client_for_bound_callback(monkeypatch):
+    started = []
+    monkeypatch.setattr(feishu_client.lark.ws.Client, "start", lambda self: started.append(self))
+
+    class Handler:
+        def on_reply(self, data):
+            pass
+
+    handler = Handler()
+    client = _client()
+    client.start_ws_listener(handler.on_reply)
+    client.reconnect_ws(handler.on_reply)
+    client.reconnect_ws(handler.on_reply)
+
+    assert len(started) == 3
+    assert started[0] is started[1] is started[2]
@@ -0,0 +1,67 @@
+"""Tests for the feishu-bridge daemon's pending-file handling."""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent / "feishu-bridge"
+sys.path.insert(0, str(ROOT))
+
+pytest.importorskip("lark_oapi")
+
+import daemon  # noqa: E402
+
+
+@pytest.fixture
+def bridge(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon, "STATE_DIR", str(tmp_path))
+    instance = daemon.FeishuBridgeDaemon(None)
+    yield instance
+    instance._pool.shutdown(wait=False)
+    os.close(instance._wake_r)
+    os.close(instance._wake_w)
+
+
+def test_rescan_skips_malformed_pending_files(bridge, tmp_path):
+    (tmp_path / "list.json").write_text("[1, 2]")
+    (tmp_path / "bad-ts.json").write_text('{"timestamp": "abc"}')
+    (tmp_path / "broken.json").write_text("{")
+    unreadable = tmp_path / "unreadable.json"
+    unreadable.write_text("{}")
+    unreadable.chmod(0)
+    good = tmp_path / "good.json"
+    good.write_text(json.dumps({"window_id": "3", "timestamp": 1.0}))
+
+    bridge._rescan_state_dir()
+
+    expected = {str(good)}
+    if os.access(unreadable, os.R_OK):  # root ignores file permissions
+        expected.add(str(unreadable))
+    assert set(bridge._pending) == expected
+    assert bridge._by_window == {"3": {str(good)}}
+
+
+def test_queued_acks_merge_without_overtaking_replies(bridge):
+    sent = []
+    done = threading.Event()
+
+    def record(text):
+        sent.append(text)
+        if len(sent) == 3:
+            done.set()
+
+    bridge.feishu.send_text_message = record
+    bridge._ack("✅ a")
+    bridge._post(record, "reply")
+    bridge._ack("✅ b")
+    bridge._ack("✅ c")
+    threading.Thread(target=bridge._sender_loop, daemon=True).start()
+
+    assert done.wait(2)
+    assert sent == ["✅ a", "reply", "✅ b\n✅ c"]
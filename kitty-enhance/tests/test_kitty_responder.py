@@ -0,0 +1,119 @@
+"""Tests for feishu-bridge kitty remote control helpers."""
+
+from __future__ import annotations
+
+import json
+import socket
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent / "feishu-bridge"
+sys.path.insert(0, str(ROOT))
+
+import kitty_responder  # noqa: E402
+
+
+def _fake_kitty(path: str, commands: list, connections: list, drop_next_focus=None):
+    """Minimal kitty RC server: answers unless no_response is set, hangs up after "text:bye".
+
+    When drop_next_focus is set, the next focus-window frame is discarded unprocessed
+    and the connection is closed, like kitty hanging up with the frame still unread.
+    """
+    hung_up = threading.Event()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    def handle(conn):
+        buf = b""
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                return
+            buf += data
+            while b"\x1b\\" in buf:
+                raw, _, buf = buf.partition(b"\x1b\\")
+                request = json.loads(raw[len(b"\x1bP@kitty-cmd"):])
+                if drop_next_focus is not None and drop_next_focus.is_set() \
+                        and request["cmd"] == "focus-window":
+                    drop_next_focus.clear()
+                    conn.close()
+                    return
+                commands.append(request["cmd"])
+                if request.get("no_response"):
+                    continue
+                reply = "one\n\ntwo\nthree\n" if request["cmd"] == "get-text" else None
+                conn.sendall(
+                    b"\x1bP@kitty-cmd" + json.dumps({"ok": True, "data": reply}).encode() + b"\x1b\\"
+                )
+                if request["payload"].get("data") == "text:bye":
+                    conn.close()
+                    hung_up.set()
+                    return
+
+    def serve():
+        while True:
+            conn, _ = server.accept()
+            connections.append(conn)
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server, hung_up
+
+
+def test_commands_reuse_connection_and_reconnect_after_hangup(tmp_path):
+    path = str(tmp_path / "kitty.sock")
+    commands, connections = [], []
+    server, hung_up = _fake_kitty(path, commands, connections)
+    target = f"unix:{path}"
+    try:
+        assert kitty_responder.get_terminal_screen("1", target, 2) == "two\nthree"
+        kitty_responder.send_keys("1", ["down", "down"], target)
+        assert len(connections) == 1
+
+        kitty_responder.send_keystroke("1", "bye", target)
+        assert hung_up.wait(2)
+        kitty_responder.send_keystroke("1", "y", target)
+        assert len(connections) == 2
+        assert commands == [
+            "get-text",
+            "focus-window", "send-key",
+            "focus-window", "send-text",
+            "focus-window", "send-text",
+        ]
+    finally:
+        server.close()
+        kitty_responder.get_conn(target).close()
+
+
+def test_close_conns_drops_connections_to_exited_kitty(tmp_path):
+    path = str(tmp_path / "kitty.sock")
+    commands, connections = [], []
+    server, _ = _fake_kitty(path, commands, connections)
+    target = f"unix:{path}"
+    try:
+        kitty_responder.clear_screen("1", target)
+        assert kitty_responder.get_conn(target).sock is not None
+        assert kitty_responder.close_conns({target, "unix:@other"}) == 1
+        assert kitty_responder.get_conn(target).sock is None
+    finally:
+        server.close()
+        kitty_responder.get_conn(target).close()
+
+
+def test_focus_lost_on_hangup_is_replayed_before_the_retried_keystroke(tmp_path):
+    path = str(tmp_path / "kitty.sock")
+    commands, connections = [], []
+    drop_next_focus = threading.Event()
+    server, _ = _fake_kitty(path, commands, connections, drop_next_focus)
+    target = f"unix:{path}"
+    try:
+        kitty_responder.clear_screen("1", target)
+        drop_next_focus.set()
+        kitty_responder.send_keystroke("1", "y", target)
+        assert len(connections) == 2
+        assert commands == ["clear-screen", "focus-window", "send-text"]
+    finally:
+        server.close()
+        kitty_responder.get_conn(target).close()
@@ -49,3 +49,71 @@ def test_resolve_terminal_selector_requires_full_id_when_ambiguous():
 
     assert resolved is None
     assert [item["terminal_id"] for item in ambiguous] == ["1@mykitty-a", "1@mykitty-b"]
+
+
+def test_load_registry_reuses_parse_until_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "registry.json"
+    path.write_text(json.dumps({
+        "1@k": {"window_id": "1", "kitty_socket": "unix:@k", "status": "idle"},
+    }), encoding="utf-8")
+    monkeypatch.setattr(registry, "REGISTRY_FILE", str(path))
+
+    first = registry.load_registry()
+    first["1@k"]["status"] = "mutated"
+    monkeypatch.setattr(registry, "_json_loads", None)  # a cache hit must not reparse
+    assert registry.load_registry()["1@k"]["status"] == "idle"
+
+    monkeypatch.undo()
+    monkeypatch.setattr(registry, "REGISTRY_FILE", str(path))
+    registry.save_registry({"2@k": {"window_id": "2", "kitty_socket": "unix:@k"}})
+    assert list(registry.load_registry()) == ["2@k"]
+
+
+def test_save_registry_primes_the_parse_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "REGISTRY_FILE", str(tmp_path / "registry.json"))
+    registry.save_registry({"3@k": {"window_id": "3", "kitty_socket": "unix:@k"}})
+    monkeypatch.setattr(registry, "_json_loads", None)  # our own write must not be reparsed
+    assert registry.load_registry()["3@k"]["terminal_id"] == "3@k"
+
+
+def test_scan_and_cleanup_lists_each_socket_once(tmp_path, monkeypatch):
+    path = tmp_path / "registry.json"
+    path.write_text(json.dumps({
+        "9@k": {"window_id": "9", "kitty_socket": "unix:@k", "status": "idle"},
+    }), encoding="utf-8")
+    monkeypatch.setattr(registry, "REGISTRY_FILE", str(path))
+    monkeypatch.setattr(registry, "_get_sockets", lambda: ["unix:@k"])
+    calls = []
+
+    def fake_ls(socket):
+        calls.append(socket)
+        return [{"tabs": [{"title": "demo", "windows": [
+            {"id": 1, "foreground_processes": [{"cmdline": ["claude"], "cwd": "/w"}]},
+            {"id": 2, "foreground_processes": [{"cmdline": ["bash"]}]},
+        ]}]}]
+
+    monkeypatch.setattr(registry, "_kitty_ls", fake_ls)
+
+    assert registry.scan_and_cleanup_all_kitty() == (1, 1)
+    assert calls == ["unix:@k"]
+    assert list(registry.load_registry()) == ["1@k"]
+
+
+def test_scan_persists_title_changes_of_known_terminals(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "REGISTRY_FILE", str(tmp_path / "registry.json"))
+    monkeypatch.setattr(registry, "_get_sockets", lambda: ["unix:@k"])
+    title = ["first"]
+    monkeypatch.setattr(registry, "_kitty_ls", lambda socket: [{"tabs": [{"title": title[0], "windows": [
+        {"id": 1, "foreground_processes": [{"cmdline": ["claude"]}]},
+    ]}]}])
+    saves = []
+    save = registry.save_registry
+    monkeypatch.setattr(registry, "save_registry", lambda data: saves.append(1) or save(data))
+
+    assert registry.scan_and_cleanup_all_kitty() == (1, 0)
+    assert registry.scan_and_cleanup_all_kitty() == (0, 0)
+    assert len(saves) == 1  # nothing changed, nothing written
+
+    title[0] = "second"
+    registry.scan_and_cleanup_all_kitty()
+    assert registry.load_registry()["1@k"]["tab_title"] == "second"